@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+import lib.metrics
+from lib.datastructures import parse_number
+
+# responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+class ClassifiedIndex:
+    """In-memory index of current and historical classifieds.
+
+    Built once from the seen caches and then updated with the results of every
+    tracker cycle, so serving requests never touches the disk or ss.com.
+    """
+
+    def __init__(self):
+        # records keyed by profile name and classified hash
+        self.records = {}
+        # secondary indexes: hash -> keys, profile -> keys (a dict keeps their order),
+        # keys of current records per profile and the numbers filtered on per key
+        self.by_hash = {}
+        self.by_profile = {}
+        self.current = {}
+        self.numbers = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def _put(self, key: tuple, record: dict) -> None:
+        if key not in self.records:
+            self.by_hash.setdefault(key[1], []).append(key)
+            self.by_profile.setdefault(key[0], {})[key] = None
+        self.records[key] = record
+        self.numbers[key] = {
+            attribute: parse_number(record.get(attribute))
+            for attribute in ("rooms", "price")
+        }
+
+    def add_history(self, items, profile: str = None) -> None:
+        """Add already seen classifieds, for example those in a Cache."""
+        with self.lock:
+            for item in items:
+                if not hasattr(item, "to_dict"):
+                    continue
+                key = (profile, item.hash)
+                if key in self.records:
+                    continue
+                record = item.to_dict()
+                record.update(
+                    {
+                        "profile": profile,
+                        "category": record["type"],
+                        "status": "old",
+                        "current": False,
+                    }
+                )
+                self._put(key, record)
+            self.version += 1
+
+    def update(self, results: dict, profile: str = None) -> None:
+        """Mark the results of a tracker cycle as current, the rest as history."""
+        with self.lock:
+            for key in self.current.pop(profile, ()):
+                self.records[key]["current"] = False
+            current = self.current[profile] = set()
+            for category in results:
+                for status in ("new", "old"):
+                    for classified in results[category][status]:
+                        record = classified.to_dict()
+                        record.update(
+                            {
+                                "profile": profile,
+                                "category": category,
+                                "status": status,
+                                "current": True,
+                            }
+                        )
+                        key = (profile, classified.hash)
+                        self._put(key, record)
+                        current.add(key)
+            self.version += 1
+
+    def get(self, classified_hash: str, profile: str = None) -> dict:
+        """Return the record of a classified, of any profile unless one is given."""
+        with self.lock:
+            for key in self.by_hash.get(classified_hash, ()):
+                if profile in (None, key[0]):
+                    return self.records[key]
+        return None
+
+    def query(self, params: dict) -> list:
+        """Return records matching all given filters.
+
+        Supported filters are profile, category, status, current, street,
+        q (text in the title), min_rooms, max_rooms, min_price and max_price.
+        All filters are checked in a single pass over the records of the profile,
+        or of all profiles if none is given.
+        """
+        checks = []
+        for param in ("category", "status"):
+            if param in params:
+                checks.append(lambda key, r, param=param: r[param] == params[param])
+        if "current" in params:
+            current = params["current"].lower() in ("1", "true", "yes")
+            checks.append(lambda key, r: r["current"] == current)
+        if "street" in params:
+            street = params["street"].lower()
+            checks.append(lambda key, r: street in r.get("street", "").lower())
+        if "q" in params:
+            text = params["q"].lower()
+            checks.append(lambda key, r: text in r["title"].lower())
+        for param, attribute, keep in (
+            ("min_rooms", "rooms", lambda value, limit: value >= limit),
+            ("max_rooms", "rooms", lambda value, limit: value <= limit),
+            ("min_price", "price", lambda value, limit: value >= limit),
+            ("max_price", "price", lambda value, limit: value <= limit),
+        ):
+            if param in params:
+                limit = float(params[param])
+
+                def check(key, r, attribute=attribute, keep=keep, limit=limit):
+                    value = self.numbers[key][attribute]
+                    return value is not None and keep(value, limit)
+
+                checks.append(check)
+        with self.lock:
+            if "profile" in params:
+                keys = self.by_profile.get(params["profile"], {})
+            else:
+                keys = self.records
+            return [
+                self.records[key]
+                for key in keys
+                if all(check(key, self.records[key]) for check in checks)
+            ]
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Read-only JSON API.
+
+    GET /classifieds lists classifieds, query parameters filter them
+    and `limit` and `offset` page through them.
+    GET /classifieds/<hash> returns a single classified.
+    GET /metrics returns the tracker metrics in the Prometheus text format.
+    """
+
+    # set by ApiServer
+    index: ClassifiedIndex = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path.rstrip("/")
+        try:
+            if path == "/classifieds" or path.startswith("/classifieds/"):
+                self.send_classifieds(path, params)
+            elif path == "/metrics":
+                self.send_text(lib.metrics.REGISTRY.render())
+            elif path == "/health":
+                self.send_json({"status": "ok", "version": self.index.version})
+            else:
+                self.send_error(404)
+        except ValueError as e:
+            self.send_error(400, str(e))
+
+    def send_classifieds(self, path: str, params: dict) -> None:
+        # the ETag is known before the response is built, so a 304 costs nothing,
+        # and taken first, so that it never claims newer data than was sent
+        etag = self.etag(path, params)
+        if self.is_not_modified(etag):
+            return
+        if path == "/classifieds":
+            self.send_json(self.list_classifieds(params), etag)
+            return
+        record = self.index.get(path.split("/")[-1], params.get("profile"))
+        if record is None:
+            self.send_error(404, "Classified not found")
+        else:
+            self.send_json(record, etag)
+
+    def list_classifieds(self, params: dict) -> dict:
+        limit = int(params.pop("limit", 100))
+        offset = int(params.pop("offset", 0))
+        records = self.index.query(params)
+        return {
+            "total": len(records),
+            "offset": offset,
+            "classifieds": records[offset : offset + limit],
+        }
+
+    def etag(self, path: str, params: dict) -> str:
+        """Return the ETag of a response, it changes whenever the index does.
+
+        It is weak, as the same data is sent either compressed or not.
+        """
+        query = urllib.parse.urlencode(sorted(params.items()))
+        key = f"{self.index.version}:{path}?{query}"
+        return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()}"'
+
+    def is_not_modified(self, etag: str) -> bool:
+        """Answer 304 and return True if the client already has the response."""
+        tags = [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]
+        if etag not in tags:
+            return False
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        return True
+
+    def send_json(self, data: object, etag: str = None) -> None:
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+        # caches must not serve the compressed body to clients that did not ask for it
+        self.send_header("Vary", "Accept-Encoding")
+        if (
+            "gzip" in self.headers.get("Accept-Encoding", "")
+            and len(body) >= GZIP_MIN_SIZE
+        ):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, text: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"API request from {self.address_string()}: {format % args}")
+
+
+class ApiServer:
+    """Serve the index over HTTP from a background thread."""
+
+    def __init__(self, index: ClassifiedIndex, host: str = "", port: int = 8080):
+        handler = type("Handler", (ApiRequestHandler,), {"index": index})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self) -> None:
+        logger.info(f"Serving API on port {self.port}")
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
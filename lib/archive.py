@@ -0,0 +1,167 @@
+import array
+import contextlib
+import json
+import math
+import mmap
+import os
+import statistics
+import tempfile
+import time
+from loguru import logger
+from lib.cache import file_lock
+from lib.datastructures import parse_number
+
+# column name and array type code of every column,
+# all values of a column have the same size, so row n is at offset n * itemsize
+COLUMNS = {
+    "ad": "Q",
+    "timestamp": "d",
+    "price": "d",
+    "price_per_m": "d",
+    "space": "d",
+    "rooms": "d",
+    "street": "I",
+}
+
+# the attribute of a classified stored in every numeric column
+ATTRIBUTES = ("price", "price_per_m", "space", "rooms")
+
+
+def ad_id(hash: str) -> int:
+    """Return the 64 bit id of a classified, taken from the start of its hash."""
+    return int(hash[:16], 16)
+
+
+class PriceArchive:
+    """Append-only columnar archive of classified price observations.
+
+    Every column is a file of fixed-width values, one per observation.
+    Reads map the files into memory and look at the raw values,
+    so aggregating millions of observations creates no Python objects
+    other than the numbers it is looking at.
+    Streets are stored as ids into a dictionary kept in `streets.json`.
+    Missing numbers are stored as NaN.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.streets_file = os.path.join(directory, "streets.json")
+        self.streets = self._read_streets()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return the archive configured by `price_archive` in settings, None if not set."""
+        if not getattr(settings, "price_archive", None):
+            return None
+        return cls(settings.price_archive)
+
+    def column_file(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.col")
+
+    def _read_streets(self) -> list:
+        if not os.path.exists(self.streets_file):
+            return []
+        with open(self.streets_file) as f:
+            return json.load(f)
+
+    def _write_streets(self) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.streets, f, ensure_ascii=False)
+        os.replace(tmp_name, self.streets_file)
+
+    def append(self, classifieds: list, timestamp: float = None) -> int:
+        """Append an observation of every classified, return the number appended."""
+        timestamp = time.time() if timestamp is None else timestamp
+        # several workers may append at the same time, rows must not interleave
+        with file_lock(self.column_file("ad")):
+            self.streets = self._read_streets()
+            street_ids = {street: n for n, street in enumerate(self.streets)}
+            columns = {name: array.array(code) for name, code in COLUMNS.items()}
+            for classified in classifieds:
+                street = getattr(classified, "street", None) or ""
+                if street not in street_ids:
+                    street_ids[street] = len(self.streets)
+                    self.streets.append(street)
+                columns["ad"].append(ad_id(classified.hash))
+                columns["timestamp"].append(timestamp)
+                columns["street"].append(street_ids[street])
+                for attribute in ATTRIBUTES:
+                    value = parse_number(getattr(classified, attribute, None))
+                    columns[attribute].append(math.nan if value is None else value)
+            if len(self.streets) > len(self._read_streets()):
+                self._write_streets()
+            for name, values in columns.items():
+                with open(self.column_file(name), "ab") as column_file:
+                    values.tofile(column_file)
+        logger.debug(f"Appended {len(classifieds)} observations to {self.directory}")
+        return len(classifieds)
+
+    @contextlib.contextmanager
+    def columns(self, *names: str):
+        """Map the columns into memory and yield them as typed memoryviews.
+
+        Only rows present in every requested column are visible,
+        in case an append was interrupted halfway.
+        """
+        names = names or tuple(COLUMNS)
+        with contextlib.ExitStack() as stack:
+            views = {}
+            for name in names:
+                file_name = self.column_file(name)
+                if not os.path.exists(file_name) or not os.path.getsize(file_name):
+                    views[name] = memoryview(array.array(COLUMNS[name]))
+                    continue
+                column_file = stack.enter_context(open(file_name, "rb"))
+                mapped = stack.enter_context(
+                    mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+                itemsize = array.array(COLUMNS[name]).itemsize
+                usable = len(mapped) - len(mapped) % itemsize
+                views[name] = memoryview(mapped)[:usable].cast(COLUMNS[name])
+            rows = min(len(view) for view in views.values())
+            views = {name: view[:rows] for name, view in views.items()}
+            try:
+                yield views
+            finally:
+                # views must be released before their maps can be closed
+                for view in views.values():
+                    view.release()
+
+    def __len__(self):
+        with self.columns() as columns:
+            return len(columns["ad"])
+
+    def price_series(self, hash: str, column: str = "price") -> list:
+        """Return (timestamp, value) of every observation of a classified."""
+        wanted = ad_id(hash)
+        with self.columns("ad", "timestamp", column) as columns:
+            return [
+                (columns["timestamp"][n], columns[column][n])
+                for n, ad in enumerate(columns["ad"])
+                if ad == wanted
+            ]
+
+    def street_medians(self, column: str = "price_per_m", since: float = None) -> dict:
+        """Return the median of a column per street.
+
+        Every classified counts once per street, with its latest observation,
+        so that classifieds listed for a long time do not dominate.
+        """
+        latest = {}
+        with self.columns("ad", "timestamp", "street", column) as columns:
+            values = columns[column]
+            for n, timestamp in enumerate(columns["timestamp"]):
+                if since is not None and timestamp < since:
+                    continue
+                if not math.isnan(values[n]):
+                    latest[(columns["street"][n], columns["ad"][n])] = values[n]
+        # other processes may have added streets since the archive was opened
+        self.streets = self._read_streets()
+        by_street = {}
+        for (street, _), value in latest.items():
+            by_street.setdefault(self.streets[street], []).append(value)
+        return {
+            street: statistics.median(values) for street, values in by_street.items()
+        }
@@ -0,0 +1,210 @@
+import concurrent.futures
+import json
+import os
+import re
+import time
+from loguru import logger
+import lib.fetch
+from lib.retriever import classified_from_row, iter_listing_rows, request_listing
+
+# links to other pages of a listing, on ss.com the "previous" link
+# of the first page points to the last page
+PAGE_LINK = re.compile(rb'class="navi"[^>]*href="[^"]*/page(\d+)\.html"')
+
+
+def page_url(url: str, page: int) -> str:
+    """Return the URL of a page of the listing at url."""
+    url = re.sub(r"page\d+\.html$", "", url)
+    if page == 1:
+        return url
+    if not url.endswith("/"):
+        url += "/"
+    return f"{url}page{page}.html"
+
+
+def last_page(data: bytes) -> int:
+    """Return the highest page number linked from a listing page."""
+    return max((int(n) for n in PAGE_LINK.findall(data)), default=1)
+
+
+# classifieds of every page remembered in the journal, to tell if a cache still has them
+SAMPLE_SIZE = 3
+
+
+class BackfillJournal:
+    """Append-only journal of the listing pages that have been backfilled.
+
+    Every line is a JSON object of a page finished for some caches, so an
+    interrupted backfill resumes with the pages missing from the journal.
+    A line cut short by a crash is ignored, that page is simply crawled again.
+    Progress is kept per cache file and URL. A page only counts as done
+    while its cache still knows the sample of classifieds kept for it,
+    so a cache that was deleted or reset is backfilled again.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        # (cache file, url) -> page -> sample of classifieds hashes
+        self.done = {}
+        # url -> the highest page number seen
+        self.pages = {}
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Ignoring incomplete line in {file_name}")
+                        continue
+                    if entry.get("restart"):
+                        self._forget(entry["caches"], entry["url"])
+                    else:
+                        self._record(entry)
+
+    def _record(self, entry: dict) -> None:
+        url = entry["url"]
+        for cache_file in entry["caches"]:
+            self.done.setdefault((cache_file, url), {})[entry["page"]] = entry["sample"]
+        self.pages[url] = max(self.pages.get(url, 1), entry["last_page"])
+
+    def _forget(self, cache_files: list, url: str) -> None:
+        for cache_file in cache_files:
+            self.done.pop((cache_file, url), None)
+
+    def is_done(self, cache, url: str, page: int) -> bool:
+        """Return True if the page was backfilled into the cache, and the cache still has it."""
+        sample = self.done.get((cache.local_cache, url), {}).get(page)
+        return sample is not None and all(cache.is_known(h) for h in sample)
+
+    def last_page(self, url: str) -> int:
+        """Return the highest page number of url seen so far, None if none was crawled."""
+        return self.pages.get(url)
+
+    def _append(self, entries: list) -> None:
+        with open(self.file_name, "a") as f:
+            for entry in entries:
+                f.write(json.dumps({**entry, "time": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write(self, cache_files: list, entries: list) -> None:
+        """Append pages finished for the caches, as (url, page, last page, classifieds) tuples."""
+        lines = []
+        for url, page, pages, classifieds in entries:
+            entry = {
+                "caches": cache_files,
+                "url": url,
+                "page": page,
+                "last_page": pages,
+                "ads": len(classifieds),
+                "sample": [c.hash for c in classifieds[:SAMPLE_SIZE]],
+            }
+            self._record(entry)
+            lines.append(entry)
+        self._append(lines)
+
+    def restart(self, cache_files: list, url: str) -> None:
+        """Forget the progress of url for the caches, so that it is crawled again."""
+        self._forget(cache_files, url)
+        self._append([{"caches": cache_files, "url": url, "restart": True}])
+
+
+class Backfill:
+    """Crawl every page of a listing and mark its classifieds as seen.
+
+    Pages are retrieved by up to `concurrency` threads, parsed and added
+    to the caches on the calling thread. Every `checkpoint_every` pages
+    the caches are saved and only then the pages are written to the journal,
+    so a page in the journal always has its classifieds saved.
+    """
+
+    def __init__(
+        self,
+        transport,
+        journal: BackfillJournal,
+        concurrency: int = 4,
+        checkpoint_every: int = 10,
+        max_pages: int = None,
+    ):
+        self.transport = transport
+        self.journal = journal
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.max_pages = max_pages
+        self.failed = []
+
+    def _retrieve(self, url: str) -> bytes:
+        # the same headers and identities as polling, so that backfill looks no different
+        response = request_listing(self.transport, url)
+        if response.status_code != 200:
+            raise lib.fetch.FetchError(f"{url}: HTTP {response.status_code}")
+        return response.content
+
+    def run(self, url: str, ad_type: str, caches: list, restart: bool = False) -> int:
+        """Backfill all pages of url into the caches, return how many additions were made.
+
+        With restart set, pages already in the journal are crawled again.
+        """
+        cache_files = [cache.local_cache for cache in caches]
+        if restart:
+            self.journal.restart(cache_files, url)
+        added = 0
+        pending = []
+        pages = self.journal.last_page(url) or 1
+        submitted = set()
+
+        def is_done(page):
+            return all(self.journal.is_done(cache, url, page) for cache in caches)
+
+        def checkpoint():
+            for cache in caches:
+                cache.save()
+            self.journal.write(cache_files, pending)
+            logger.info(f"Backfill of {url}: {len(pending)} more pages done")
+            pending.clear()
+
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+            futures = {}
+
+            def submit_missing():
+                # the number of pages is only known once a page links to the last one
+                for page in range(1, pages + 1):
+                    if self.max_pages and page > self.max_pages:
+                        break
+                    if page in submitted or is_done(page):
+                        continue
+                    submitted.add(page)
+                    future = executor.submit(self._retrieve, page_url(url, page))
+                    futures[future] = page
+
+            submit_missing()
+            while futures:
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    page = futures.pop(future)
+                    try:
+                        data = future.result()
+                    except lib.fetch.FetchError as e:
+                        logger.error(f"Backfill of page {page} failed: {e}")
+                        self.failed.append((url, page))
+                        continue
+                    classifieds = []
+                    for row in iter_listing_rows(data):
+                        classified = classified_from_row(row, ad_type)
+                        if not classified:
+                            continue
+                        classifieds.append(classified)
+                        for cache in caches:
+                            if not cache.is_known(classified):
+                                cache.add(classified)
+                                added += 1
+                    pages = max(pages, last_page(data))
+                    pending.append((url, page, pages, classifieds))
+                    if len(pending) >= self.checkpoint_every:
+                        checkpoint()
+                submit_missing()
+        if pending:
+            checkpoint()
+        return added
@@ -0,0 +1,80 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Fixed size Bloom filter.
+
+    Answers membership queries with no false negatives and a false positive
+    rate of about `error_rate` as long as no more than `capacity` keys are added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        """Size the bit array and number of hashes for capacity and error rate."""
+        if capacity < 1:
+            raise ValueError("Bloom filter capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("Bloom filter error rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, key: object):
+        """Derive hash_count bit positions from one sha256 digest (double hashing)."""
+        digest = hashlib.sha256(str(key).encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: object) -> None:
+        """Add a key to the filter."""
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: object) -> bool:
+        """Return True if the key has probably been added."""
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by adding larger stages as it fills up.
+
+    Each new stage has double the capacity and half the error rate of the
+    previous one, which keeps the overall false positive rate below
+    twice the configured `error_rate` no matter how many keys are added.
+    """
+
+    def __init__(self, error_rate: float = 0.001, initial_capacity: int = 10000):
+        """Construct an empty filter."""
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.stages = []
+
+    def __len__(self):
+        return sum(stage.count for stage in self.stages)
+
+    def __contains__(self, key: object) -> bool:
+        """Return True if the key has probably been added."""
+        return any(key in stage for stage in self.stages)
+
+    def add(self, key: object) -> None:
+        """Add a key, starting a new stage if the current one is full."""
+        if not self.stages or self.stages[-1].is_full():
+            n = len(self.stages)
+            self.stages.append(
+                BloomFilter(
+                    self.initial_capacity * 2 ** n, self.error_rate / 2 ** (n + 1)
+                )
+            )
+        self.stages[-1].add(key)
@@ -1,10 +1,46 @@
+import contextlib
 import datetime
+import fcntl
 import os
 import pickle
+import tempfile
+import time
 from loguru import logger
+import lib.bloom
+import lib.metrics
 import lib.settings
 
 
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold an advisory lock on a sidecar `.lock` file while the block runs.
+
+    Shared locks are used for reading, exclusive locks for writing.
+    The lock file is never removed, so that all processes lock the same inode.
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_umask() -> int:
+    """Return the umask of the process, it can only be read by setting it."""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def cache_key(item: object) -> object:
+    """Return the identity of a cached item.
+
+    Classifieds are identified by their sha256 hash, anything else by itself.
+    """
+    return getattr(item, "hash", item)
+
+
 class Cache:
     """Generic cache class."""
 
@@ -20,18 +56,93 @@ class Cache:
             self.local_cache = local_cache
             logger.debug("Using cache file from constructor arguments")
         self.settings = settings
+        # in shared mode several processes may use the same cache file,
+        # so reads and writes are locked and saving merges with what is on disk
+        self.shared = bool(getattr(settings, "shared_cache", False))
+        # with a retention policy, items that fall out of the retention window
+        # are moved to the cold tier, a Bloom filter kept next to the cache file
+        self.retention_days = getattr(settings, "cache_retention_days", None)
+        self.retention_count = getattr(settings, "cache_retention_count", None)
+        self.bloom_error_rate = (
+            getattr(settings, "cache_bloom_error_rate", None) or 0.001
+        )
+        self.cold_cache = f"{self.local_cache}.cold"
+        # items added and keys evicted since the cache was loaded or last saved
+        self._added = []
+        self._evicted = []
 
         self.cache = None
+        self.cold = None
         if not self.load_cache_from_disk():
             self.create_new_cache()
+        if self.cold is None and self.retention_enabled():
+            self.cold = self.create_new_cold_tier()
+        self._build_index()
+
+    def retention_enabled(self) -> bool:
+        return bool(self.retention_days or self.retention_count)
+
+    def _build_index(self) -> None:
+        """Index the keys of cached items for constant time lookups."""
+        self._index = {cache_key(item) for item in self.cache}
+        if self.cold is not None:
+            # items cached before retention was enabled age from now on
+            now = datetime.datetime.now()
+            for key in self._index:
+                self.cold["added_at"].setdefault(key, now)
+        self._report_size()
+
+    @staticmethod
+    def _read_file(file_name: str) -> object:
+        with open(file_name, "rb") as cache_file:
+            return pickle.load(cache_file)
+
+    @staticmethod
+    def _write_file(file_name: str, data: object) -> None:
+        """Write the file atomically, so readers never see a partial file."""
+        cache_dir = os.path.dirname(os.path.abspath(file_name))
+        fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                # mkstemp creates the file readable by its owner only
+                os.fchmod(fd, 0o666 & ~current_umask())
+                pickle.dump(data, cache_file)
+            os.replace(tmp_name, file_name)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def _read_cold_tier(self) -> dict:
+        if not os.path.exists(self.cold_cache):
+            return self.create_new_cold_tier()
+        return self._read_file(self.cold_cache)
+
+    def _write_to_disk(self) -> None:
+        # the cold tier goes first, if writing the cache fails afterwards
+        # evicted items are in both tiers, which is harmless
+        if self.retention_enabled():
+            self._write_file(self.cold_cache, self.cold)
+        self._write_file(self.local_cache, self.cache)
+
+    def _report_size(self) -> None:
+        lib.metrics.SEEN_CACHE_ITEMS.set(
+            len(self._index), cache=self.local_cache, tier="hot"
+        )
+        if self.cold is not None:
+            lib.metrics.SEEN_CACHE_ITEMS.set(
+                len(self.cold["bloom"]), cache=self.local_cache, tier="cold"
+            )
 
     def load_cache_from_disk(self) -> bool:
         """Load cache from pickle file."""
         if not os.path.exists(self.local_cache):
             return False
         logger.debug("Loading cache file from disk")
-        cache_file = open(self.local_cache, "rb")
-        self.cache = pickle.load(cache_file)
+        lock = file_lock(self.local_cache, shared=True)
+        with lock if self.shared else contextlib.nullcontext():
+            self.cache = self._read_file(self.local_cache)
+            if self.retention_enabled():
+                self.cold = self._read_cold_tier()
         return True
 
     def create_new_cache(self):
@@ -39,6 +150,13 @@ class Cache:
         logger.debug("Creating a new cache object")
         self.cache = []
 
+    def create_new_cold_tier(self) -> dict:
+        """Initialize new cold tier with no evicted items."""
+        return {
+            "added_at": {},
+            "bloom": lib.bloom.ScalableBloomFilter(self.bloom_error_rate),
+        }
+
     def __del__(self) -> None:
         """Save cache upon destruction."""
         logger.debug(f"Destructor called for Cache object {self}")
@@ -47,17 +165,102 @@ class Cache:
     def add(self, item: object) -> bool:
         """Add an item to the cache."""
         logger.debug(f"Adding item {str(item)[:20]} to cache")
-        return self.cache.append(item)
+        self._added.append(item)
+        self._index.add(cache_key(item))
+        if self.cold is not None:
+            self.cold["added_at"][cache_key(item)] = datetime.datetime.now()
+        self.cache.append(item)
+        self._report_size()
 
     def is_known(self, item: object) -> bool:
-        """Return True if object is in cache."""
-        return item in self.cache
+        """Return True if object is in cache.
+
+        Items in the cold tier are known with a small false positive rate.
+        """
+        t_start = time.perf_counter()
+        key = cache_key(item)
+        known = key in self._index or (
+            self.cold is not None and key in self.cold["bloom"]
+        )
+        lib.metrics.SEEN_CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - t_start)
+        return known
+
+    def compact(self) -> int:
+        """Move items outside of the retention window to the cold tier.
+
+        Returns the number of evicted items.
+        """
+        if not self.retention_enabled():
+            return 0
+        added_at = self.cold["added_at"]
+        now = datetime.datetime.now()
+        newest_first = sorted(
+            self.cache, key=lambda i: added_at.get(cache_key(i), now), reverse=True
+        )
+        evicted = []
+        if self.retention_count:
+            evicted = newest_first[self.retention_count :]
+            newest_first = newest_first[: self.retention_count]
+        if self.retention_days:
+            cutoff = now - datetime.timedelta(days=self.retention_days)
+            evicted += [
+                i for i in newest_first if added_at.get(cache_key(i), now) < cutoff
+            ]
+        if not evicted:
+            return 0
+        evicted_keys = {cache_key(item) for item in evicted}
+        for key in evicted_keys:
+            self.cold["bloom"].add(key)
+            added_at.pop(key, None)
+        self._evicted.extend(evicted_keys)
+        self.cache = [i for i in self.cache if cache_key(i) not in evicted_keys]
+        self._index -= evicted_keys
+        self._report_size()
+        logger.info(f"Moved {len(evicted_keys)} items to the cold tier")
+        return len(evicted_keys)
+
+    def merge(self, disk_cache: object) -> object:
+        """Merge items added by this process into the cache read from disk."""
+        known = {cache_key(item) for item in disk_cache}
+        for item in self._added:
+            if cache_key(item) not in known:
+                disk_cache.append(item)
+                known.add(cache_key(item))
+        return disk_cache
+
+    def merge_cold_tier(self, disk_cold: dict) -> dict:
+        """Merge items added and evicted by this process into the cold tier read from disk."""
+        for key in self._evicted:
+            disk_cold["bloom"].add(key)
+        for item in self._added:
+            key = cache_key(item)
+            if key in self.cold["added_at"]:
+                disk_cold["added_at"].setdefault(key, self.cold["added_at"][key])
+        return disk_cold
 
     def save(self) -> None:
         """Save cache to pickle file."""
-        with open(self.local_cache, "wb") as cache_file:
-            pickle.dump(self.cache, cache_file)
+        if not self.shared:
+            self.compact()
+            self._write_to_disk()
+            self._added = []
+            self._evicted = []
             logger.debug(f"Cache saved to file: {self.local_cache}")
+            return
+        if not self._added and os.path.exists(self.local_cache):
+            logger.debug(f"Nothing new to save to shared cache {self.local_cache}")
+            return
+        with file_lock(self.local_cache):
+            if os.path.exists(self.local_cache):
+                self.cache = self.merge(self._read_file(self.local_cache))
+                if self.retention_enabled():
+                    self.cold = self.merge_cold_tier(self._read_cold_tier())
+                self._build_index()
+            self.compact()
+            self._write_to_disk()
+            self._added = []
+            self._evicted = []
+        logger.debug(f"Shared cache merged and saved to file: {self.local_cache}")
 
     def cache_file_exists(self) -> bool:
         if not os.path.exists(self.local_cache):
@@ -73,6 +276,16 @@ class DataCache(Cache):
         """Constructor calls parent and overrides local_cache."""
         Cache.__init__(self, settings, local_cache=settings.data_cache)
 
+    def retention_enabled(self) -> bool:
+        """Response data is replaced on every update, so it is never evicted."""
+        return False
+
+    def _build_index(self) -> None:
+        """Keys are looked up directly in the data dictionary."""
+
+    def _write_to_disk(self) -> None:
+        self._write_file(self.local_cache, self.cache)
+
     def __contains__(self, item):
         """For the membership operator."""
         return item in self.cache["data"].keys()
@@ -84,19 +297,34 @@ class DataCache(Cache):
     def get_timestamp(self) -> datetime:
         return self.cache["last_update"]
 
+    def get_url_timestamp(self, key: str) -> datetime:
+        """Return the time the key was last updated.
+
+        Caches written before per key timestamps existed fall back to the
+        timestamp of the whole cache.
+        """
+        return self.cache.get("updated", {}).get(key, self.cache["last_update"])
+
     def get(self, key: str) -> object:
         """Returns cache object."""
         return self.cache["data"][key]
 
-    def is_fresh(self):
+    def is_fresh(self, key: str = None):
         """Return True if cache is fresh.
 
         Returns True if cache age in seconds is less than defined in 'cache_freshness' variable in settings.
+        If key is given, only the freshness of that key is considered.
         """
-        if not self.cache_file_exists():
-            return False
+        if key is None:
+            if not self.cache_file_exists():
+                return False
+            cache_timestamp = self.get_timestamp()
+        else:
+            if key not in self:
+                logger.debug(f"Cache does not contain {key}")
+                return False
+            cache_timestamp = self.get_url_timestamp(key)
         current_timestamp = datetime.datetime.now()
-        cache_timestamp = self.get_timestamp()
         delta = current_timestamp - cache_timestamp
         delta_seconds = delta.total_seconds()
         if delta_seconds > self.settings.cache_validity_time:
@@ -108,9 +336,24 @@ class DataCache(Cache):
 
     def add(self, key: str, item: object) -> None:
         """Add an item to the cache."""
+        now = datetime.datetime.now()
         self.cache["data"][key] = item
-        self.cache["last_update"] = datetime.datetime.now()
+        self.cache.setdefault("updated", {})[key] = now
+        self.cache["last_update"] = now
+        self._added.append(key)
 
     def is_known(self, key: str) -> bool:
         """Return True if key is in cache."""
         return key in self.cache["data"].keys()
+
+    def merge(self, disk_cache: object) -> object:
+        """Merge keys updated by this process into the cache read from disk."""
+        updated = disk_cache.setdefault("updated", {})
+        for key in set(self._added):
+            disk_cache["data"][key] = self.cache["data"][key]
+            updated[key] = self.get_url_timestamp(key)
+        timestamps = [
+            t for t in (disk_cache["last_update"], self.cache["last_update"]) if t
+        ]
+        disk_cache["last_update"] = max(timestamps) if timestamps else None
+        return disk_cache
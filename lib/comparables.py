@@ -0,0 +1,225 @@
+import heapq
+import math
+import re
+from lib.datastructures import Apartment, House, parse_number
+
+# weight of every numeric feature, so that one unit of each weighs about the same:
+# a room, 10 m² of space and 3 floors
+WEIGHTS = (1.0, 0.1, 1 / 3)
+
+# squared distance added when the series or the street differs
+CATEGORY_PENALTY = 1.0
+
+# new points are kept aside and searched linearly until there are this many,
+# then they become a tree of their own
+PENDING_MAX = 64
+
+
+def street_name(street: str) -> str:
+    """Return the street without the house number, "Tērbatas 14a" becomes "Tērbatas".
+
+    Only numbers after the first word are house numbers, "1. maija 5" becomes "1. maija".
+    """
+    return re.sub(r"(?<=\S)\s+\d.*$", "", (street or "").strip()).lower()
+
+
+def price_per_m(classified) -> float:
+    """Return the price per m², computed from the price and space if not listed."""
+    value = parse_number(getattr(classified, "price_per_m", None))
+    if value is None:
+        price = parse_number(getattr(classified, "price", None))
+        space = parse_number(getattr(classified, "space", None))
+        if price and space:
+            value = price / space
+    return value
+
+
+def features(classified) -> tuple:
+    """Return the weighted numeric features and the categories of a classified.
+
+    None if a feature is missing, such classifieds can not be compared.
+    """
+    floor = getattr(classified, "floor", None) or getattr(classified, "floors", None)
+    values = (
+        parse_number(getattr(classified, "rooms", None)),
+        parse_number(getattr(classified, "space", None)),
+        parse_number(floor),
+    )
+    if None in values:
+        return None
+    point = tuple(v * w for v, w in zip(values, WEIGHTS))
+    categories = (getattr(classified, "series", None), street_name(classified.street))
+    return point, categories
+
+
+class KDTree:
+    """Static k-d tree over points having the same number of dimensions.
+
+    Nodes are (point, item, axis, left, right) tuples, split at the median.
+    """
+
+    def __init__(self, entries: list):
+        """Build the tree from (point, item) pairs."""
+        self.size = len(entries)
+        self.root = self._build(list(entries), 0)
+
+    def _build(self, entries: list, depth: int):
+        if not entries:
+            return None
+        axis = depth % len(entries[0][0])
+        entries.sort(key=lambda e: e[0][axis])
+        median = len(entries) // 2
+        point, item = entries[median]
+        return (
+            point,
+            item,
+            axis,
+            self._build(entries[:median], depth + 1),
+            self._build(entries[median + 1 :], depth + 1),
+        )
+
+    def nearest(self, point: tuple, k: int, penalty=None) -> list:
+        """Return up to k (squared distance, item) pairs nearest to point, nearest first.
+
+        penalty(item) is added to the squared distance of every item,
+        it must not be negative, as the tree is pruned by the point distance only.
+        """
+        # max heap of the best k found so far, by negated distance
+        best = []
+        counter = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            node_point, item, axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, node_point))
+            if penalty:
+                distance += penalty(item)
+            counter += 1
+            if len(best) < k:
+                heapq.heappush(best, (-distance, counter, item))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, counter, item))
+            diff = point[axis] - node_point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # the far side is only searched if it can hold something closer
+            if len(best) < k or diff * diff < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return [(-d, item) for d, _, item in sorted(best, reverse=True)]
+
+
+class ComparablesIndex:
+    """Nearest neighbour index of apartments and houses seen before.
+
+    Classifieds are compared by rooms, space and floor, and a differing series
+    or street counts as extra distance. The price per m² of a new classified
+    is ranked among its k nearest comparables of the same search, as searches
+    of other regions, or for rent instead of sale, are not comparable.
+
+    Every search keeps a few k-d trees of doubling sizes. New points
+    are collected until there are PENDING_MAX of them, and become a tree,
+    merged with the smaller trees into one of the next size. So adding a point
+    costs O(log² n) on average and a lookup searches O(log n) trees.
+    """
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        # per (search, category): known hashes, trees from the largest
+        # and the points added since the last tree was built
+        self.known = {}
+        self.trees = {}
+        self.pending = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return an index for `comparables` in settings, None if it is not set."""
+        if not getattr(settings, "comparables", None):
+            return None
+        return cls(settings.comparables)
+
+    @staticmethod
+    def _key(classified, search: str) -> tuple:
+        return search, type(classified).__name__.lower()
+
+    def add(self, classified, search: str) -> bool:
+        """Add a classified found by a search (its URL).
+
+        Returns False if it was known or can not be compared.
+        """
+        if not isinstance(classified, (Apartment, House)):
+            return False
+        key = self._key(classified, search)
+        known = self.known.setdefault(key, set())
+        if classified.hash in known:
+            return False
+        value = price_per_m(classified)
+        found = features(classified)
+        if value is None or found is None:
+            return False
+        point, categories = found
+        known.add(classified.hash)
+        pending = self.pending.setdefault(key, [])
+        pending.append((point, (categories, value)))
+        if len(pending) >= PENDING_MAX:
+            trees = self.trees.setdefault(key, [])
+            entries = pending
+            # merge the smaller trees, so that sizes keep doubling
+            while trees and trees[-1].size <= len(entries):
+                entries = entries + self._entries(trees.pop().root)
+            trees.append(KDTree(entries))
+            self.pending[key] = []
+        return True
+
+    def _entries(self, node) -> list:
+        entries = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node is not None:
+                entries.append((node[0], node[1]))
+                stack.extend((node[3], node[4]))
+        return entries
+
+    def update(self, classifieds, search: str) -> int:
+        """Add the classifieds of a search that are not known yet, return how many were added."""
+        return sum(self.add(c, search) for c in classifieds)
+
+    def nearest(self, classified, search: str) -> list:
+        """Return the prices per m² of the k nearest comparables, nearest first."""
+        found = features(classified)
+        if found is None:
+            return []
+        point, categories = found
+
+        def penalty(entry):
+            return CATEGORY_PENALTY * sum(a != b for a, b in zip(categories, entry[0]))
+
+        key = self._key(classified, search)
+        candidates = []
+        for tree in self.trees.get(key, []):
+            candidates += tree.nearest(point, self.k, penalty)
+        for other, entry in self.pending.get(key, []):
+            distance = sum((a - b) ** 2 for a, b in zip(point, other))
+            candidates.append((distance + penalty(entry), entry))
+        candidates = heapq.nsmallest(self.k, candidates, key=lambda c: c[0])
+        return [entry[1] for _, entry in candidates]
+
+    def score(self, classified, search: str) -> bool:
+        """Set price_percentile and comparable_count of a classified found by a search.
+
+        The percentile is the share of comparables cheaper per m²,
+        so a low percentile is a good deal. Returns False if there is
+        nothing to compare with.
+        """
+        value = price_per_m(classified)
+        if value is None:
+            return False
+        prices = self.nearest(classified, search)
+        if not prices:
+            return False
+        cheaper = sum(p < value for p in prices) + sum(p == value for p in prices) / 2
+        classified.price_percentile = math.floor(100 * cheaper / len(prices))
+        classified.comparable_count = len(prices)
+        return True
@@ -1,7 +1,18 @@
 import hashlib
+import re
 from loguru import logger
 
 
+def parse_number(text) -> float:
+    """Return the first number in a text like "90,000  €", None if there is none."""
+    if text is None:
+        return None
+    match = re.search(r"\d+(?:[ ,]\d{3})*(?:\.\d+)?", str(text))
+    if not match:
+        return None
+    return float(match.group().replace(",", "").replace(" ", ""))
+
+
 class Classified:
     """Base class for all classifieds"""
 
@@ -36,6 +47,10 @@ class Classified:
         """Return hash based on title and street."""
         return hashlib.sha256(str(self.title + self.street).encode("utf-8")).hexdigest()
 
+    def to_dict(self) -> dict:
+        """Return all attributes along with the classified type."""
+        return {"type": type(self).__name__.lower(), **vars(self)}
+
 
 class Animal:
     """Base class for all animals"""
@@ -71,6 +86,10 @@ class Animal:
         """Return hash based on title and street."""
         return hashlib.sha256(str(self.title + self.age).encode("utf-8")).hexdigest()
 
+    def to_dict(self) -> dict:
+        """Return all attributes along with the classified type."""
+        return {"type": type(self).__name__.lower(), **vars(self)}
+
 
 class Apartment(Classified):
     def __str__(self):
@@ -0,0 +1,174 @@
+import contextlib
+import hashlib
+import os
+import random
+import re
+from loguru import logger
+from lib.cache import Cache, cache_key, file_lock
+
+# Mersenne prime used as the modulus of the permutation hashes
+PRIME = (1 << 61) - 1
+
+
+def shingles(classified) -> set:
+    """Return the features of a classified compared when looking for reposts.
+
+    The title is split into words, so that a slightly reworded title still
+    shares most of its features with the original. Street, rooms and space are
+    whole features. Price is left out on purpose, as it is what reposts tweak.
+    """
+    features = set(re.findall(r"\w+", classified.title.lower()))
+    for attribute in ("street", "rooms", "space", "age"):
+        value = getattr(classified, attribute, None)
+        if value:
+            features.add(f"{attribute}:{str(value).strip().lower()}")
+    return features
+
+
+def lsh_bands(num_perm: int, threshold: float) -> int:
+    """Return the number of bands that puts the LSH s-curve just below threshold.
+
+    Pairs with a Jaccard similarity of s become candidates with probability
+    1 - (1 - s^r)^b, which rises steepest around (1/b)^(1/r). Keeping that
+    point below the threshold favours finding reposts over fewer comparisons.
+    For thresholds below any such point, every band is a single row.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Repost threshold must be above 0 and at most 1: {threshold}")
+    divisors = [b for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [b for b in divisors if (1 / b) ** (b / num_perm) <= threshold]
+    if not below:
+        return num_perm
+    return min(below, key=lambda b: threshold - (1 / b) ** (b / num_perm))
+
+
+class RepostIndex:
+    """MinHash LSH index over the classifieds seen so far.
+
+    Every classified gets a MinHash signature of its shingles. Signatures are
+    split into bands, and classifieds sharing all values of any band land in
+    the same bucket. A lookup only compares signatures within its buckets,
+    so it stays fast no matter how large the history is.
+    The index is kept in a pickle file next to the seen cache.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shared: bool = False,
+    ):
+        self.file_name = file_name
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = lsh_bands(num_perm, threshold)
+        self.rows = num_perm // self.bands
+        self.shared = shared
+        rng = random.Random(num_perm)
+        self.permutations = [
+            (rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(num_perm)
+        ]
+        # classified hash -> signature
+        self.signatures = {}
+        # per band: band values -> hashes of classifieds
+        self.buckets = [{} for _ in range(self.bands)]
+        self._added = []
+        if os.path.exists(file_name):
+            lock = file_lock(file_name, shared=True)
+            with lock if shared else contextlib.nullcontext():
+                self._load(Cache._read_file(file_name))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return an index for the profile, None if repost detection is not enabled."""
+        if not getattr(settings, "repost_threshold", None):
+            return None
+        return cls(
+            f"{settings.local_cache}.lsh",
+            settings.repost_threshold,
+            shared=bool(getattr(settings, "shared_cache", False)),
+        )
+
+    def _load(self, data: dict) -> None:
+        if data["num_perm"] != self.num_perm:
+            logger.warning(
+                f"Repost index {self.file_name} uses other parameters, rebuilding it"
+            )
+            return
+        for key, signature in data["signatures"].items():
+            self._insert(key, signature)
+
+    def signature(self, classified) -> tuple:
+        hashes = [
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little"
+            )
+            for s in shingles(classified)
+        ] or [0]
+        return tuple(
+            min((a * h + b) % PRIME for h in hashes) for a, b in self.permutations
+        )
+
+    def _band_keys(self, signature: tuple):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows]
+
+    def _insert(self, key: str, signature: tuple) -> None:
+        if key in self.signatures:
+            return
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, classified) -> bool:
+        return cache_key(classified) in self.signatures
+
+    def add(self, classified) -> None:
+        key = cache_key(classified)
+        if key in self.signatures:
+            return
+        self._insert(key, self.signature(classified))
+        self._added.append(key)
+
+    def update(self, classifieds) -> None:
+        """Add the classifieds that are not in the index yet."""
+        for classified in classifieds:
+            self.add(classified)
+
+    def find(self, classified):
+        """Return (hash, similarity) of the most similar other classified.
+
+        Returns None if there is no classified at least `threshold` similar.
+        """
+        key = cache_key(classified)
+        signature = self.signatures.get(key) or self.signature(classified)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        candidates.discard(key)
+        best = None
+        for candidate in candidates:
+            other = self.signatures[candidate]
+            similarity = sum(a == b for a, b in zip(signature, other)) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def save(self) -> None:
+        """Save the index, merging with what other processes saved if shared."""
+        if not self._added and os.path.exists(self.file_name):
+            return
+        lock = file_lock(self.file_name)
+        with lock if self.shared else contextlib.nullcontext():
+            if self.shared and os.path.exists(self.file_name):
+                self._load(Cache._read_file(self.file_name))
+            Cache._write_file(
+                self.file_name,
+                {"num_perm": self.num_perm, "signatures": self.signatures},
+            )
+            self._added = []
+        logger.debug(f"Repost index saved to file: {self.file_name}")
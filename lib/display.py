@@ -1,47 +1,117 @@
+import csv
+import json
+import sys
 from rich.console import Console
 from rich.table import Table
 
 console = Console()
 
+# table title and (column name, attribute) pairs for every classified type
+TABLES = {
+    "apartment": (
+        "Apartments",
+        [
+            ("Apartment", "title"),
+            ("Street", "street"),
+            ("Rooms", "rooms"),
+            ("Floor", "floor"),
+        ],
+    ),
+    "house": ("Houses", [("House", "title"), ("Street", "street")]),
+    "dog": ("Dogs", [("Dog", "title"), ("Age", "age"), ("Price", "price")]),
+}
 
-def print_results_to_console(results):
-    # display results and send push notifications
-    apartment_table = Table(title="Apartments")
-    apartment_table.add_column("Apartment")
-    apartment_table.add_column("Street")
-    apartment_table.add_column("Rooms")
-    apartment_table.add_column("Floor")
-    house_table = Table(title="Houses")
-    house_table.add_column("House")
-    house_table.add_column("Street")
-
-    dog_table = Table(title="Dogs")
-    dog_table.add_column("Dog")
-    dog_table.add_column("Age")
-    dog_table.add_column("Price")
-
-    # display the results
-    for apartment in results["apartment"]["new"]:
-        apartment_table.add_row(
-            f"[bold red] {apartment.title}[/bold red]",
-            apartment.street,
-            apartment.rooms,
-            apartment.floor,
-        )
-    for apartment in results["apartment"]["old"]:
-        apartment_table.add_row(
-            apartment.title, apartment.street, apartment.rooms, apartment.floor
+# columns of the CSV output, attributes a classified does not have are left empty
+CSV_FIELDS = [
+    "profile",
+    "category",
+    "status",
+    "type",
+    "title",
+    "street",
+    "age",
+    "rooms",
+    "space",
+    "floor",
+    "floors",
+    "land",
+    "series",
+    "price_per_m",
+    "price",
+    "price_percentile",
+    "hash",
+    "repost_of",
+]
+
+
+def print_results_to_console(results, title=None, max_rows=None):
+    """Print a table for every classified type, new classifieds first.
+
+    With max_rows set, every table shows at most that many rows,
+    followed by a count of the rows left out.
+    """
+    if title:
+        console.rule(title)
+    for classified_type in results:
+        if classified_type not in TABLES:
+            continue
+        table_title, columns = TABLES[classified_type]
+        table = Table(title=table_title)
+        for column_name, _ in columns:
+            table.add_column(column_name)
+        rows = [(True, c) for c in results[classified_type]["new"]]
+        rows += [(False, c) for c in results[classified_type]["old"]]
+        shown = rows if max_rows is None else rows[:max_rows]
+        for is_new, classified in shown:
+            values = [str(getattr(classified, name, "")) for _, name in columns]
+            if is_new and getattr(classified, "repost_of", None):
+                values[0] = f"[yellow] {values[0]} (repost)[/yellow]"
+            elif is_new:
+                values[0] = f"[bold red] {values[0]}[/bold red]"
+            table.add_row(*values)
+        if len(shown) < len(rows):
+            table.add_row(f"[italic]... {len(rows) - len(shown)} more[/italic]")
+        console.print(table)
+
+
+class NdjsonWriter:
+    """Write every classified as a JSON object on its own line."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, classified_type, status, classified, profile=None):
+        record = {"profile": profile, "category": classified_type, "status": status}
+        record.update(classified.to_dict())
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.stream.flush()
+
+
+class CsvWriter:
+    """Write every classified as a CSV row, the header goes before the first row."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.writer = csv.DictWriter(
+            self.stream, fieldnames=CSV_FIELDS, restval="", extrasaction="ignore"
         )
-    console.print(apartment_table)
-
-    for house in results["house"]["new"]:
-        house_table.add_row(f"[bold red] {house.title}[/bold red]", house.street)
-    for house in results["apartment"]["old"]:
-        house_table.add_row(house.title, house.street)
-    console.print(house_table)
-
-    for dog in results["dog"]["new"]:
-        dog_table.add_row(f"[bold red] {dog.title}[/bold red]", dog.age, dog.price)
-    for dog in results["dog"]["old"]:
-        dog_table.add_row(dog.title, dog.age, dog.price)
-    console.print(dog_table)
+        self.header_written = False
+
+    def write(self, classified_type, status, classified, profile=None):
+        if not self.header_written:
+            self.writer.writeheader()
+            self.header_written = True
+        record = {"profile": profile, "category": classified_type, "status": status}
+        record.update(classified.to_dict())
+        self.writer.writerow(record)
+        self.stream.flush()
+
+
+WRITERS = {"ndjson": NdjsonWriter, "csv": CsvWriter}
+
+
+def get_writer(output_format, stream=None):
+    """Return a streaming writer for the format, or None for table output."""
+    if output_format not in WRITERS:
+        return None
+    return WRITERS[output_format](stream)
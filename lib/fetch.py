@@ -0,0 +1,219 @@
+import concurrent.futures
+import random
+import threading
+import time
+import urllib.parse
+import requests
+from loguru import logger
+import lib.metrics
+
+
+class FetchError(Exception):
+    """A URL could not be retrieved."""
+
+    # whether the failure counts against the host in its circuit breaker
+    host_failure = True
+    # whether the request may succeed if it is sent again
+    retry = True
+
+
+class CircuitOpenError(FetchError):
+    """Requests to the host are not attempted, as it failed too often recently."""
+
+
+class Response:
+    """Response of a transport, independent of the HTTP library used."""
+
+    def __init__(self, url, status_code, headers, content, elapsed):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # seconds it took to retrieve the response
+        self.elapsed = elapsed
+
+
+class HttpTransport:
+    """Retrieve URLs over HTTP."""
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 30):
+        self.timeout = (connect_timeout, read_timeout)
+
+    def get(self, url: str, headers: dict = None, proxy: str = None) -> Response:
+        t_start = time.perf_counter()
+        proxies = {"http": proxy, "https": proxy} if proxy else None
+        try:
+            r = requests.get(
+                url, headers=headers, timeout=self.timeout, proxies=proxies
+            )
+        except requests.RequestException as e:
+            raise FetchError(f"{url}: {e}") from e
+        return Response(
+            url,
+            r.status_code,
+            dict(r.headers),
+            r.content,
+            time.perf_counter() - t_start,
+        )
+
+
+class CircuitBreaker:
+    """Stop requesting a host after it failed several times in a row.
+
+    After failure_threshold consecutive failures the circuit opens and requests
+    fail right away. After reset_timeout seconds one request is let through,
+    if it succeeds the circuit closes again, otherwise it stays open.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened_at = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.reset_timeout:
+                # half open, let one request through and wait for its result
+                self.opened_at[host] = time.monotonic()
+                return True
+            return False
+
+    def record_success(self, host: str) -> None:
+        with self.lock:
+            self.failures[host] = 0
+            if self.opened_at.pop(host, None) is not None:
+                logger.info(f"Circuit for {host} closed")
+                lib.metrics.CIRCUIT_OPEN.set(0, host=host)
+
+    def record_failure(self, host: str) -> None:
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.failure_threshold:
+                if host not in self.opened_at:
+                    logger.warning(f"Circuit for {host} opened")
+                self.opened_at[host] = time.monotonic()
+                lib.metrics.CIRCUIT_OPEN.set(1, host=host)
+
+
+class ResilientTransport:
+    """Retry, hedge and circuit-break requests of another transport.
+
+    Responses without a 2xx status fail, so that a block or error page
+    never replaces good data. Failed requests and responses with a 5xx,
+    403 or 429 status are retried up to `retries` times,
+    waiting a random time up to backoff * 2^attempt in between.
+    With hedge_after set, a second identical request is started if the first
+    has not finished after that many seconds, and whichever finishes first wins.
+    No request of a URL starts later than `deadline` seconds after the first one.
+    """
+
+    def __init__(
+        self,
+        transport,
+        retries: int = 2,
+        backoff: float = 1,
+        max_backoff: float = 30,
+        hedge_after: float = None,
+        deadline: float = 120,
+        breaker: CircuitBreaker = None,
+    ):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        self.executor = None
+        if hedge_after is not None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(4)
+
+    @classmethod
+    def from_settings(cls, settings, transport=None):
+        """Wrap transport, by default HttpTransport, as configured by `fetch` in settings.
+
+        With `identities` in settings, the default transport uses an identity pool.
+        """
+        config = getattr(settings, "fetch", None) or {}
+        if transport is None:
+            transport = HttpTransport(
+                config.get("connect_timeout", 5), config.get("read_timeout", 30)
+            )
+            identities = getattr(settings, "identities", None)
+            if identities:
+                import lib.identity
+
+                transport = lib.identity.IdentityTransport.from_settings(
+                    identities, transport
+                )
+        return cls(
+            transport,
+            config.get("retries", 2),
+            config.get("backoff", 1),
+            config.get("max_backoff", 30),
+            config.get("hedge_after"),
+            config.get("deadline", 120),
+            CircuitBreaker(
+                config.get("failure_threshold", 3), config.get("reset_timeout", 300)
+            ),
+        )
+
+    def _get_once(self, url: str, headers: dict) -> Response:
+        response = self.transport.get(url, headers)
+        status = response.status_code
+        if not 200 <= status < 300:
+            error = FetchError(f"{url}: HTTP {status}")
+            # other client errors, like a missing page, do not go away by retrying
+            error.retry = error.host_failure = status >= 500 or status in (403, 429)
+            raise error
+        return response
+
+    def _get_hedged(self, url: str, headers: dict) -> Response:
+        futures = [self.executor.submit(self._get_once, url, headers)]
+        done, _ = concurrent.futures.wait(futures, timeout=self.hedge_after)
+        if not done:
+            logger.debug(f"Sending hedged request for {url}")
+            lib.metrics.FETCH_HEDGES.inc(url=url)
+            futures.append(self.executor.submit(self._get_once, url, headers))
+        error = None
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                return future.result()
+            except FetchError as e:
+                error = e
+        raise error
+
+    def get(self, url: str, headers: dict = None) -> Response:
+        host = urllib.parse.urlsplit(url).netloc
+        t_start = time.monotonic()
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow(host):
+                raise CircuitOpenError(f"Circuit for {host} is open, skipping {url}")
+            try:
+                if self.executor:
+                    response = self._get_hedged(url, headers)
+                else:
+                    response = self._get_once(url, headers)
+            except FetchError as e:
+                if e.host_failure:
+                    self.breaker.record_failure(host)
+                delay = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2 ** attempt)
+                )
+                if (
+                    not e.retry
+                    or attempt == self.retries
+                    or time.monotonic() - t_start + delay > self.deadline
+                ):
+                    raise
+                logger.warning(f"{e}, retrying in {delay:.1f} seconds")
+                lib.metrics.FETCH_RETRIES.inc(url=url)
+                time.sleep(delay)
+                continue
+            self.breaker.record_success(host)
+            return response
@@ -1,53 +1,109 @@
 from loguru import logger
 from typing import Tuple, List
+import lib.keywords
 import lib.settings
 
 
 class Filter:
-    def __init__(self, retriever, cache, settings: lib.settings.Settings):
+    def __init__(
+        self,
+        retriever,
+        cache,
+        settings: lib.settings.Settings,
+        reposts=None,
+        comparables=None,
+    ):
         self.retriever = retriever
         self.cache = cache
+        # optional lib.dedup.RepostIndex, new classifieds similar to known ones are reposts
+        self.reposts = reposts
+        # optional lib.comparables.ComparablesIndex, new classifieds are priced against it
+        self.comparables = comparables
+        self.keywords = lib.keywords.KeywordMatcher.from_settings(settings)
         self.settings = settings
         self.tracking_list = self.settings.tracking_list
+        # classifieds not seen before per URL, whether they match the criteria or not
+        self.new_counts = {}
 
-    def filter_tracking_list(self):
+    def filter_tracking_list(self, on_result=None):
+        """Filter all classified types in the tracking list.
+
+        If given, on_result(classified_type, status, classified) is called for
+        every result as soon as it is found, status being either "new" or "old".
+        """
         results = {}
         for classified_type in self.tracking_list:
             results[classified_type] = {}
             url = self.tracking_list[classified_type]["url"]
-            results_new, results_old = self.filter_by_type(classified_type, url)
+            results_new, results_old = self.filter_by_type(
+                classified_type, url, on_result
+            )
             results[classified_type]["new"] = results_new
             results[classified_type]["old"] = results_old
         return results
 
-    def filter_by_type(self, classified_type: str, url: str) -> Tuple[List, List]:
+    def filter_by_type(
+        self, classified_type: str, url: str, on_result=None
+    ) -> Tuple[List, List]:
         logger.info(f"Looking for type: {classified_type} using URL: {url}")
-        k = self.retriever.get_ss_data_from_cache(url)
-        ad_list = self.retriever.get_ad_list(k, classified_type)
+        ad_list = self.retriever.get_ads(url, classified_type, self.cache.is_known)
         results_old = []
         results_new = []
         for a in ad_list:
 
             if self.cache.is_known(a):
-                logger.info(f"OLD: {a} [{a.get_hash()}]")
+                logger.debug(f"OLD: {a} [{a.hash}]")
                 results_old.append(a)
+                if on_result:
+                    on_result(classified_type, "old", a)
             else:
                 self.cache.add(a)
-                logger.info(f"NEW: {a} [{a.get_hash()}]")
-
-                if classified_type == "apartment":
-                    if (
-                        int(a.rooms)
-                        >= self.tracking_list[classified_type]["filter_room_count"]
-                    ):
-                        logger.debug("NEW Apartment matching filtering criteria found")
-                        results_new.append(a)
-                elif classified_type == "house":
-                    logger.info(f"NEW House found: {a}")
-                    results_new.append(a)
-                elif classified_type == "dog":
-                    logger.info(f"NEW Dog found: {a}")
+                self.new_counts[url] = self.new_counts.get(url, 0) + 1
+                logger.info(f"NEW: {a} [{a.hash}]")
+                if self.reposts is not None:
+                    self.check_repost(a)
+                if self.comparables is not None and self.comparables.score(a, url):
+                    logger.info(
+                        f"PRICE per m² higher than {a.price_percentile}%"
+                        f" of {a.comparable_count} comparables: {a}"
+                    )
+                if self.keywords is not None:
+                    a.keywords = self.keywords.find_in_classified(a)
+                    if a.keywords:
+                        logger.info(f"KEYWORDS {', '.join(a.keywords)}: {a}")
+                # keyword alerts are reported even if the criteria do not match
+                if self.matches_criteria(classified_type, a) or getattr(
+                    a, "keywords", None
+                ):
                     results_new.append(a)
-                else:
-                    logger.info(f"Not enough rooms ({a.rooms})")
+                    if on_result:
+                        on_result(classified_type, "new", a)
         return results_new, results_old
+
+    def check_repost(self, classified) -> None:
+        """Mark the classified as a repost if it is similar enough to a known one."""
+        match = self.reposts.find(classified)
+        if match:
+            classified.repost_of, classified.repost_similarity = match
+            logger.info(
+                f"REPOST of [{match[0]}] ({match[1]:.0%} similar): {classified}"
+            )
+        self.reposts.add(classified)
+
+    def matches_criteria(self, classified_type: str, classified) -> bool:
+        """Return True if a new classified matches the criteria of its tracking list entry."""
+        if classified_type == "apartment":
+            if (
+                int(classified.rooms)
+                >= self.tracking_list[classified_type]["filter_room_count"]
+            ):
+                logger.debug("NEW Apartment matching filtering criteria found")
+                return True
+            logger.debug(f"Not enough rooms ({classified.rooms})")
+        elif classified_type == "house":
+            logger.info(f"NEW House found: {classified}")
+            return True
+        elif classified_type == "dog":
+            logger.info(f"NEW Dog found: {classified}")
+            return True
+        return False
@@ -0,0 +1,202 @@
+import itertools
+import threading
+import time
+import urllib.parse
+from loguru import logger
+import lib.metrics
+from lib.fetch import FetchError
+
+# markers of challenge pages served instead of the real content when being throttled,
+# specific to challenges, as ordinary pages may embed captcha scripts as well
+CAPTCHA_MARKERS = (
+    b"cf-challenge",
+    b"challenge-form",
+    b"cf_chl_",
+    b"captcha-container",
+    b"Too many requests",
+)
+
+# status codes that mean the client is being throttled or blocked
+THROTTLE_STATUS_CODES = (403, 429, 503)
+
+
+class ThrottledError(FetchError):
+    """The response shows the identity used for the request is being throttled.
+
+    It only counts against the host once every identity is cooling down,
+    until then other identities are tried instead.
+    """
+
+    host_failure = False
+
+
+class Identity:
+    """User agent and optional proxy used for a request."""
+
+    def __init__(self, name: str, user_agent: str, proxy: str = None):
+        self.name = name
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.cooldown_until = 0
+        self.requests = 0
+        self.throttles = 0
+
+    def __str__(self):
+        return self.name
+
+    def is_cooling_down(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def health(self) -> float:
+        """Share of requests that were not throttled, 1 for unused identities."""
+        if not self.requests:
+            return 1
+        return 1 - self.throttles / self.requests
+
+
+class IdentityPool:
+    """Pool of identities, every user agent combined with every proxy.
+
+    Identities are used round robin or, with the `health` strategy, the one
+    throttled least often is used first. A throttled identity cools down
+    and is not used for `cooldown` seconds, unless all of them are cooling down.
+    """
+
+    def __init__(
+        self,
+        user_agents: list,
+        proxies: list = None,
+        strategy: str = "round_robin",
+        cooldown: float = 600,
+    ):
+        if not user_agents:
+            raise ValueError("At least one user agent is needed")
+        if strategy not in ("round_robin", "health"):
+            raise ValueError(f"Unknown identity strategy: {strategy}")
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.identities = []
+        for (n, user_agent), proxy in itertools.product(
+            enumerate(user_agents), proxies or [None]
+        ):
+            name = f"ua{n}"
+            if proxy:
+                # the host only, proxy URLs may contain credentials
+                name += f"@{urllib.parse.urlsplit(proxy).hostname}"
+            self.identities.append(Identity(name, user_agent, proxy))
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> Identity:
+        """Return the identity to use for the next request."""
+        with self.lock:
+            now = time.time()
+            available = [i for i in self.identities if not i.is_cooling_down(now)]
+            if not available:
+                identity = min(self.identities, key=lambda i: i.cooldown_until)
+                logger.warning(f"All identities are cooling down, using {identity}")
+            elif self.strategy == "health":
+                identity = max(available, key=lambda i: (i.health(), -i.requests))
+            else:
+                # first available identity after the one used last
+                identity = min(
+                    available,
+                    key=lambda i: (self.identities.index(i) - self.next)
+                    % len(self.identities),
+                )
+            self.next = self.identities.index(identity) + 1
+            identity.requests += 1
+        self.report_cooling()
+        return identity
+
+    def report_throttled(self, identity: Identity, reason: str) -> None:
+        """Cool the identity down after it was throttled."""
+        with self.lock:
+            identity.throttles += 1
+            identity.cooldown_until = time.time() + self.cooldown
+        logger.warning(
+            f"Identity {identity} throttled ({reason}), cooling down for {self.cooldown} seconds"
+        )
+        lib.metrics.THROTTLES.inc(identity=identity.name, reason=reason)
+        self.report_cooling()
+
+    def report_cooling(self) -> None:
+        now = time.time()
+        lib.metrics.IDENTITIES_COOLING.set(
+            sum(i.is_cooling_down(now) for i in self.identities)
+        )
+
+    def all_cooling(self) -> bool:
+        now = time.time()
+        return all(i.is_cooling_down(now) for i in self.identities)
+
+
+def detect_throttle(
+    response, required_marker: bytes = None, captcha_markers=CAPTCHA_MARKERS
+) -> str:
+    """Return why the response looks like throttling, None if it looks fine."""
+    if response.status_code in THROTTLE_STATUS_CODES:
+        return f"status {response.status_code}"
+    if response.status_code != 200:
+        return None
+    content = response.content.lower()
+    for marker in captcha_markers:
+        if marker.lower() in content:
+            return "captcha"
+    if required_marker and required_marker not in response.content:
+        return "degraded page"
+    return None
+
+
+class IdentityTransport:
+    """Send every request with an identity from the pool and watch for throttling.
+
+    Throttled responses raise ThrottledError, so that the request can be
+    retried, with another identity.
+    """
+
+    def __init__(
+        self,
+        pool: IdentityPool,
+        transport,
+        required_marker: str = None,
+        captcha_markers: list = None,
+    ):
+        self.pool = pool
+        self.transport = transport
+        self.required_marker = required_marker.encode() if required_marker else None
+        self.captcha_markers = CAPTCHA_MARKERS
+        if captcha_markers is not None:
+            self.captcha_markers = [m.encode() for m in captcha_markers]
+
+    @classmethod
+    def from_settings(cls, config: dict, transport):
+        """Create the transport from the `identities` settings."""
+        pool = IdentityPool(
+            config["user_agents"],
+            config.get("proxies"),
+            config.get("strategy", "round_robin"),
+            config.get("cooldown", 600),
+        )
+        return cls(
+            pool,
+            transport,
+            config.get("required_marker", "filter_frm"),
+            config.get("captcha_markers"),
+        )
+
+    def get(self, url: str, headers: dict = None):
+        identity = self.pool.acquire()
+        headers = {**(headers or {}), "User-Agent": identity.user_agent}
+        logger.debug(f"Requesting {url} as {identity}")
+        if identity.proxy:
+            response = self.transport.get(url, headers, proxy=identity.proxy)
+        else:
+            response = self.transport.get(url, headers)
+        reason = detect_throttle(response, self.required_marker, self.captcha_markers)
+        if reason:
+            self.pool.report_throttled(identity, reason)
+            error = ThrottledError(f"{url}: throttled ({reason}) as {identity}")
+            error.host_failure = self.pool.all_cooling()
+            raise error
+        return response
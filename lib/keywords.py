@@ -0,0 +1,84 @@
+import collections
+from lib.search import fold
+
+# attributes of a classified that are scanned for keywords
+SCANNED_ATTRIBUTES = ("title", "street", "series", "age", "description")
+
+
+class KeywordMatcher:
+    """Find any of many keywords in a text with a single pass (Aho-Corasick).
+
+    All keywords are compiled into one automaton, a trie with failure links,
+    so scanning a text takes time proportional to its length no matter
+    how many keywords there are. Matching ignores case and diacritics
+    and only matches whole words, "ar" is not found in "parks".
+    """
+
+    def __init__(self, keywords: list):
+        # per state: transitions, failure link, keywords ending in this state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a matcher for `keyword_alerts` in settings, None if there are none."""
+        keywords = getattr(settings, "keyword_alerts", None)
+        if not keywords:
+            return None
+        return cls(keywords)
+
+    def _add(self, keyword: str) -> None:
+        folded = fold(keyword.strip())
+        if not folded:
+            return
+        state = 0
+        for char in folded:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((keyword, len(folded)))
+
+    def _build_failure_links(self) -> None:
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                # keywords ending at the failure state end here as well
+                self.output[next_state] = (
+                    self.output[next_state] + self.output[self.fail[next_state]]
+                )
+
+    def find(self, text: str) -> set:
+        """Return the keywords found in the text, as they were configured."""
+        text = fold(text)
+        found = set()
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for keyword, length in self.output[state]:
+                start = end - length
+                if (start == 0 or not text[start - 1].isalnum()) and (
+                    end == len(text) or not text[end].isalnum()
+                ):
+                    found.add(keyword)
+        return found
+
+    def find_in_classified(self, classified) -> list:
+        """Return the keywords found in any text attribute of the classified, sorted."""
+        texts = [getattr(classified, a, None) for a in SCANNED_ATTRIBUTES]
+        # one scan over all attributes, the separator keeps words apart
+        return sorted(self.find("\n".join(t for t in texts if isinstance(t, str))))
@@ -3,6 +3,12 @@ import sys
 import time
 from loguru import logger
 
+# loguru's default format
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
 
 def func_log(function_name):
     """Decorator for logging and timing function execution."""
@@ -24,12 +30,101 @@ def func_log(function_name):
     return log_it
 
 
-def set_up_logging(debug=False, log_file_name="tracker.log", rotation="10 MB"):
+class LogFilter:
+    """Decide which records a sink writes.
+
+    levels maps module names to minimum levels, the longest matching prefix
+    wins, for example {"lib.filter": "WARNING", "lib": "INFO"}.
+    Modules not listed use default_level.
+    With rate_limit set, every line of code logs at most that many records
+    below WARNING per second, the number of dropped records is added
+    to the extra of the next record that gets through, and shown by format().
+    """
+
+    def __init__(self, default_level="DEBUG", levels=None, rate_limit=None):
+        self.default_level = logger.level(default_level).no
+        self.levels = sorted(
+            (
+                (module, logger.level(level).no)
+                for module, level in (levels or {}).items()
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self.rate_limit = rate_limit
+        # per line of code: start of the current second, records let through, records dropped
+        self.windows = {}
+
+    def min_level(self, name: str) -> int:
+        for module, level in self.levels:
+            if name == module or name.startswith(module + "."):
+                return level
+        return self.default_level
+
+    def __call__(self, record) -> bool:
+        if record["level"].no < self.min_level(record["name"] or ""):
+            return False
+        if not self.rate_limit or record["level"].no >= logger.level("WARNING").no:
+            return True
+        key = (record["name"], record["line"])
+        now = record["time"].timestamp()
+        start, passed, dropped = self.windows.get(key, (now, 0, 0))
+        if now - start >= 1:
+            start, passed = now, 0
+        if passed >= self.rate_limit:
+            self.windows[key] = (start, passed, dropped + 1)
+            return False
+        if dropped:
+            # records are shared by all sinks, the message is left as it is
+            record["extra"]["suppressed"] = dropped
+        self.windows[key] = (start, passed + 1, 0)
+        return True
+
+    @staticmethod
+    def format(record) -> str:
+        """Return the format of a sink using this filter, noting suppressed records."""
+        if record["extra"].get("suppressed"):
+            return (
+                LOG_FORMAT
+                + " [{extra[suppressed]} similar messages suppressed]\n{exception}"
+            )
+        return LOG_FORMAT + "\n{exception}"
+
+
+def set_up_logging(
+    debug=False,
+    log_file_name="tracker.log",
+    rotation="10 MB",
+    enqueue=False,
+    serialize=False,
+    levels=None,
+    rate_limit=None,
+    compression="zip",
+    file_level=None,
+):
+    """Log to a rotated file, and to stderr for warnings or everything with debug.
+
+    The file gets INFO and above, or everything with debug, unless file_level is set.
+    With enqueue set, records are written and log files rotated and compressed
+    by a background thread instead of the code that logs.
+    With serialize set, the file has a JSON object per record.
+    levels and rate_limit limit what is written, see LogFilter.
+    """
     logger.remove()  # remove the default logger output
+    log_filter = LogFilter(
+        file_level or ("DEBUG" if debug else "INFO"), levels, rate_limit
+    )
     logger.add(
-        log_file_name, rotation=rotation, retention="1 week", compression="zip"
+        log_file_name,
+        rotation=rotation,
+        retention="1 week",
+        compression=compression,
+        enqueue=enqueue,
+        serialize=serialize,
+        filter=log_filter,
+        format=log_filter.format,
     )  # always log to a file
     logger.add(sys.stderr, level="WARNING")
     if debug:
-        logger.add(sys.stderr, level="DEBUG")
+        logger.add(sys.stderr, level="DEBUG", filter=LogFilter("DEBUG", levels))
         logger.debug("DEBUG Logging started.")
@@ -0,0 +1,227 @@
+import bisect
+import os
+import tempfile
+import threading
+
+# default histogram buckets, in seconds
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base class for metrics with optional labels."""
+
+    metric_type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.values = {}
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every sample of the metric."""
+        with self.lock:
+            values = dict(self.values)
+        for key, value in values.items():
+            yield "", dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Value that only goes up."""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            data = self.values[key]
+            data["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            data["sum"] += value
+            data["count"] += 1
+
+    def get_count(self, **labels) -> int:
+        data = self.values.get(self._key(labels))
+        return data["count"] if data else 0
+
+    def samples(self):
+        with self.lock:
+            values = {key: dict(data) for key, data in self.values.items()}
+        for key, data in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), data["buckets"]):
+                cumulative += count
+                yield "_bucket", {**labels, "le": bound}, cumulative
+            yield "_sum", labels, data["sum"]
+            yield "_count", labels, data["count"]
+
+
+class Registry:
+    """Collection of metrics that can be exported in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=TIME_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+    def write_textfile(self, file_name: str) -> None:
+        """Write metrics for the node_exporter textfile collector.
+
+        The file is replaced atomically, so the collector never reads a partial file.
+        """
+        directory = os.path.dirname(os.path.abspath(file_name))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, file_name)
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "sscom_fetch_seconds", "Time spent retrieving a URL", ["url"]
+)
+FETCH_BYTES = REGISTRY.counter(
+    "sscom_fetch_bytes_total", "Bytes retrieved from a URL", ["url"]
+)
+FETCH_RESPONSES = REGISTRY.counter(
+    "sscom_fetch_responses_total", "HTTP responses by status code", ["url", "status"]
+)
+FETCH_RETRIES = REGISTRY.counter(
+    "sscom_fetch_retries_total", "Requests retried after a failure", ["url"]
+)
+FETCH_HEDGES = REGISTRY.counter(
+    "sscom_fetch_hedges_total", "Hedged requests sent for slow responses", ["url"]
+)
+FETCH_FAILURES = REGISTRY.counter(
+    "sscom_fetch_failures_total",
+    "URLs that could not be retrieved, stale cached data is used instead",
+    ["url"],
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    "sscom_circuit_open", "1 if requests to a host are suspended", ["host"]
+)
+THROTTLES = REGISTRY.counter(
+    "sscom_throttles_total",
+    "Responses that show the identity used is being throttled",
+    ["identity", "reason"],
+)
+IDENTITIES_COOLING = REGISTRY.gauge(
+    "sscom_identities_cooling", "Identities not used after being throttled"
+)
+DATA_CACHE_LOOKUPS = REGISTRY.counter(
+    "sscom_data_cache_lookups_total",
+    "Data cache lookups, result is hit, miss or stale",
+    ["result"],
+)
+DATA_CACHE_AGE = REGISTRY.gauge(
+    "sscom_data_cache_age_seconds", "Age of the cached data of a URL", ["url"]
+)
+PARSE_SECONDS = REGISTRY.histogram(
+    "sscom_parse_seconds", "Time spent parsing the classifieds of a URL", ["url"]
+)
+ADS_PER_PAGE = REGISTRY.gauge(
+    "sscom_ads_per_page", "Classifieds parsed from a URL", ["url"]
+)
+SEEN_CACHE_ITEMS = REGISTRY.gauge(
+    "sscom_seen_cache_items", "Items in the seen cache", ["cache", "tier"]
+)
+SEEN_CACHE_LOOKUP_SECONDS = REGISTRY.histogram(
+    "sscom_seen_cache_lookup_seconds",
+    "Time spent looking up a classified in the seen cache",
+    buckets=(0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1),
+)
+NOTIFY_SECONDS = REGISTRY.histogram(
+    "sscom_notify_seconds", "Time spent delivering a notification", ["channel"]
+)
+NOTIFY_FAILURES = REGISTRY.counter(
+    "sscom_notify_failures_total",
+    "Notifications that failed or timed out",
+    ["channel"],
+)
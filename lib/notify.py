@@ -0,0 +1,249 @@
+import abc
+import asyncio
+import json
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+import requests
+from loguru import logger
+import lib.metrics
+
+PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
+
+
+class Notifier(abc.ABC):
+    """Base class for notification channels.
+
+    Channels implement send(), which blocks until the message is delivered
+    and may raise on failure. It runs in a thread of its own, so that
+    several channels deliver at the same time. All I/O of send() has to be
+    limited by `timeout`, so that the thread ends after the delivery timed out.
+    """
+
+    channel = None
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    def send(self, title: str, message: str, classified=None) -> None:
+        """Deliver a message, raise if it could not be delivered."""
+
+
+class PushoverNotifier(Notifier):
+    """Send messages with Pushover, using the pushover settings of the profile."""
+
+    channel = "pushover"
+
+    def __init__(self, settings, timeout: float = 10, url: str = PUSHOVER_API_URL):
+        super().__init__(timeout)
+        self.enabled = bool(settings.pushover_enabled)
+        self.user_key = settings.pushover_user_key
+        self.api_token = settings.pushover_api_token
+        self.url = url
+
+    def send(self, title, message, classified=None):
+        if not self.enabled:
+            print(f"Push messages not enabled! [Title: {title} Message: {message}]")
+            return
+        r = requests.post(
+            self.url,
+            data={
+                "token": self.api_token,
+                "user": self.user_key,
+                "title": title,
+                "message": message,
+            },
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+
+
+class WebhookNotifier(Notifier):
+    """POST every message as JSON to a URL."""
+
+    channel = "webhook"
+
+    def __init__(self, url: str, headers: dict = None, timeout: float = 10):
+        super().__init__(timeout)
+        self.url = url
+        self.headers = headers or {}
+
+    def send(self, title, message, classified=None):
+        payload = {
+            "title": title,
+            "message": message,
+            "classified": classified.to_dict() if classified else None,
+        }
+        r = requests.post(
+            self.url,
+            data=json.dumps(payload, default=str),
+            headers={"Content-Type": "application/json", **self.headers},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+
+
+class SmtpNotifier(Notifier):
+    """Send every message as an e-mail."""
+
+    channel = "smtp"
+
+    def __init__(
+        self,
+        host: str,
+        sender: str,
+        recipients: list,
+        port: int = 25,
+        username: str = None,
+        password: str = None,
+        starttls: bool = False,
+        timeout: float = 10,
+    ):
+        super().__init__(timeout)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def send(self, title, message, classified=None):
+        email = EmailMessage()
+        email["Subject"] = title
+        email["From"] = self.sender
+        email["To"] = ", ".join(self.recipients)
+        email.set_content(message)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(email)
+
+
+NOTIFIERS = {
+    "pushover": PushoverNotifier,
+    "webhook": WebhookNotifier,
+    "smtp": SmtpNotifier,
+}
+
+
+def create_notifier(config: dict, settings) -> Notifier:
+    """Create a channel from its settings, a dict with `type` and its options."""
+    options = dict(config)
+    channel = options.pop("type")
+    if channel not in NOTIFIERS:
+        raise ValueError(f"Unknown notification channel: {channel}")
+    if channel == "pushover":
+        return PushoverNotifier(settings, **options)
+    return NOTIFIERS[channel](**options)
+
+
+# deliveries running at the same time, the rest wait for their turn
+MAX_CONCURRENT = 16
+
+
+def _run_in_thread(func, *args) -> asyncio.Future:
+    """Run func in a daemon thread of its own and return a future of its result.
+
+    Unlike a thread pool, a hung call only holds up its own thread,
+    and does not keep the interpreter from exiting.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def set_result(result, error):
+        # the future is cancelled if the delivery timed out
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run():
+        result = error = None
+        try:
+            result = func(*args)
+        except Exception as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(set_result, result, error)
+        except RuntimeError:
+            # the loop is closed, nobody waits for this delivery anymore
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+async def _send(semaphore, notifier: Notifier, title, message, classified) -> bool:
+    # the timeout starts when the delivery starts, not while it waits for its turn
+    async with semaphore:
+        t_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                _run_in_thread(notifier.send, title, message, classified),
+                notifier.timeout,
+            )
+            return True
+        except asyncio.TimeoutError:
+            logger.error(f"Sending to {notifier.channel} timed out: {title}")
+        except Exception as e:
+            logger.error(f"Sending to {notifier.channel} failed: {e}")
+        finally:
+            lib.metrics.NOTIFY_SECONDS.observe(
+                time.perf_counter() - t_start, channel=notifier.channel
+            )
+    lib.metrics.NOTIFY_FAILURES.inc(channel=notifier.channel)
+    return False
+
+
+async def deliver(deliveries: list) -> list:
+    """Send (notifier, title, message, classified) deliveries concurrently.
+
+    Every delivery is limited by the timeout of its channel, a slow or
+    failing channel does not hold up the others.
+    Returns whether each delivery succeeded.
+    """
+    if not deliveries:
+        return []
+    # a delivery that timed out gives up its slot, its thread ends
+    # when the I/O timeout of its channel expires
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    return await asyncio.gather(
+        *(_send(semaphore, *delivery) for delivery in deliveries)
+    )
+
+
+def send_notifications(settings, results) -> list:
+    """Notify about new classifieds on the channels of their tracking list entry.
+
+    Entries without a `notify` list use Pushover, as before channels existed.
+    """
+    deliveries = []
+    for classified_type in results:
+        entry = settings.tracking_list.get(classified_type) or {}
+        configs = entry.get("notify") or [{"type": "pushover"}]
+        notifiers = [create_notifier(config, settings) for config in configs]
+        for classified in results[classified_type]["new"]:
+            if getattr(classified, "repost_of", None):
+                logger.debug(f"Not notifying about repost: {classified}")
+                continue
+            title = f"New {classified_type} found"
+            message = str(classified)
+            keywords = getattr(classified, "keywords", None)
+            if keywords:
+                message += f"\nKeywords: {', '.join(keywords)}"
+            percentile = getattr(classified, "price_percentile", None)
+            if percentile is not None:
+                message += (
+                    f"\nPrice per m² is higher than {percentile}%"
+                    f" of {classified.comparable_count} comparables"
+                )
+            for notifier in notifiers:
+                deliveries.append((notifier, title, message, classified))
+    return asyncio.run(deliver(deliveries))
@@ -0,0 +1,123 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from loguru import logger
+from rich.console import Console
+from rich.table import Table
+
+
+class Profiler:
+    """Record CPU and memory profiles of the phases of a tracker run.
+
+    Without a directory the profiler is disabled and phases cost nothing.
+    A phase entered several times, for example once per profile,
+    accumulates into the same report.
+    """
+
+    def __init__(self, directory: str = None, top: int = 10):
+        self.directory = directory
+        self.enabled = directory is not None
+        self.top = top
+        # per phase name: cProfile.Profile, wall time,
+        # memory allocated and blocks per line of code, and peak memory
+        self.profiles = {}
+        self.wall_time = {}
+        self.memory = {}
+        self.peak_memory = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Profile the code inside the block as the given phase."""
+        if not self.enabled:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        t_start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.wall_time[name] = (
+                self.wall_time.get(name, 0) + time.perf_counter() - t_start
+            )
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+            snapshot_after = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)]
+            )
+            # summed up per line, so that a long running process does not
+            # keep the statistics of every cycle
+            memory = self.memory.setdefault(name, {})
+            for stat in snapshot_after.compare_to(snapshot_before, "lineno"):
+                frame = stat.traceback[0]
+                location = f"{frame.filename}:{frame.lineno}"
+                size, count = memory.get(location, (0, 0))
+                memory[location] = (size + stat.size_diff, count + stat.count_diff)
+
+    def dump(self) -> None:
+        """Write a cProfile stats file and a memory report for every phase."""
+        if not self.enabled:
+            return
+        tracemalloc.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        for n, name in enumerate(self.profiles):
+            file_name = f"{n:02d}-{name.replace(' ', '_')}"
+            base_name = os.path.join(self.directory, file_name)
+            self.profiles[name].dump_stats(f"{base_name}.prof")
+            # allocations sorted by how much memory they added or freed
+            memory = sorted(
+                self.memory[name].items(),
+                key=lambda item: abs(item[1][0]),
+                reverse=True,
+            )
+            with open(f"{base_name}.memory.txt", "w") as memory_file:
+                for location, (size, count) in memory:
+                    memory_file.write(
+                        f"{location}: size={size / 1024:+.1f} KiB, count={count:+d}\n"
+                    )
+        logger.info(f"Profiles written to {self.directory}")
+
+    def print_summary(self, console: Console = None) -> None:
+        """Print time and memory per phase and the functions that took most time."""
+        if not self.enabled:
+            return
+        console = console or Console(stderr=True)
+        phases = Table(title="Phases")
+        for column in ("Phase", "Wall time (s)", "Allocated (KiB)", "Peak (KiB)"):
+            phases.add_column(column)
+        for name in self.profiles:
+            allocated = sum(size for size, _ in self.memory[name].values())
+            phases.add_row(
+                name,
+                f"{self.wall_time[name]:.3f}",
+                f"{allocated / 1024:.1f}",
+                f"{self.peak_memory[name] / 1024:.1f}",
+            )
+        console.print(phases)
+
+        functions = Table(title=f"Top {self.top} functions by own time")
+        for column in ("Phase", "Function", "Calls", "Own time (s)", "Cumulative (s)"):
+            functions.add_column(column)
+        rows = []
+        for name, profile in self.profiles.items():
+            for (file_name, line, function), stat in pstats.Stats(
+                profile
+            ).stats.items():
+                calls, _, own_time, cumulative, _ = stat
+                location = f"{os.path.basename(file_name)}:{line}({function})"
+                rows.append((own_time, name, location, calls, cumulative))
+        for own_time, name, location, calls, cumulative in sorted(rows, reverse=True)[
+            : self.top
+        ]:
+            functions.add_row(
+                name, location, str(calls), f"{own_time:.4f}", f"{cumulative:.4f}"
+            )
+        console.print(functions)
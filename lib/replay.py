@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from loguru import logger
+
+from lib.fetch import FetchError, Response
+
+
+def archive_file_name(directory: str, url: str) -> str:
+    return os.path.join(
+        directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".gz"
+    )
+
+
+class NotRecordedError(FetchError):
+    """There is no recorded response for the URL."""
+
+
+class RecordingTransport:
+    """Pass requests to another transport and record the responses.
+
+    Every response is stored in its own gzip file in the archive directory,
+    a line of JSON with the URL, status, headers and timing followed by the raw body.
+    Recording a URL again replaces the previous response.
+    """
+
+    def __init__(self, directory: str, transport):
+        self.directory = directory
+        self.transport = transport
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str, headers: dict = None) -> Response:
+        response = self.transport.get(url, headers)
+        meta = {
+            "url": response.url,
+            "status_code": response.status_code,
+            "headers": response.headers,
+            "elapsed": response.elapsed,
+        }
+        file_name = archive_file_name(self.directory, url)
+        with gzip.open(f"{file_name}.tmp", "wb") as archive_file:
+            archive_file.write(json.dumps(meta).encode("utf-8") + b"\n")
+            archive_file.write(response.content)
+        os.replace(f"{file_name}.tmp", file_name)
+        logger.debug(f"Recorded response for {url} to {file_name}")
+        return response
+
+
+class ReplayTransport:
+    """Serve responses recorded by RecordingTransport, without using the network.
+
+    With latency_factor set, every response is delayed by its recorded
+    retrieval time multiplied by the factor.
+    """
+
+    def __init__(self, directory: str, latency_factor: float = 0):
+        if not os.path.isdir(directory):
+            raise RuntimeError(f"Replay archive {directory} does not exist")
+        self.directory = directory
+        self.latency_factor = latency_factor
+
+    def get(self, url: str, headers: dict = None) -> Response:
+        file_name = archive_file_name(self.directory, url)
+        if not os.path.exists(file_name):
+            raise NotRecordedError(f"No recorded response for {url}")
+        with gzip.open(file_name, "rb") as archive_file:
+            meta = json.loads(archive_file.readline())
+            content = archive_file.read()
+        if self.latency_factor:
+            time.sleep(meta["elapsed"] * self.latency_factor)
+        logger.debug(f"Replaying response for {url} from {file_name}")
+        return Response(
+            meta["url"], meta["status_code"], meta["headers"], content, meta["elapsed"]
+        )
@@ -1,23 +1,141 @@
+import datetime
 import sys
+import time
 from loguru import logger
-import requests
-from lxml import html
+from lxml import etree, html
 import feedparser
 import lib.settings
 import lib.cache
+import lib.fetch
+import lib.metrics
 
 from lib.datastructures import Apartment, House, Dog
 from lib.log import func_log
 
+# size of the chunks fed to the streaming parser
+PARSE_CHUNK_SIZE = 16384
+
+# column of every attribute in the listing table, street or age are the first ones
+COLUMNS = {
+    "apartment": {
+        "street": 4,
+        "rooms": 5,
+        "space": 6,
+        "floor": 7,
+        "series": 8,
+        "price_per_m": 9,
+        "price": 10,
+    },
+    "house": {"street": 4, "space": 5, "floors": 6, "rooms": 7, "land": 8, "price": 9},
+    "dog": {"age": 4, "price": 5},
+}
+
+
+# sent with every request of a listing page, an identity pool replaces the User-Agent
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.132 Safari/537.36"
+}
+
+
+def request_listing(transport, url: str):
+    """Request a listing page through the transport as a browser would."""
+    return transport.get(url, headers=dict(HEADERS))
+
+
+def iter_listing_rows(data: bytes, chunk_size: int = PARSE_CHUNK_SIZE):
+    """Yield the rows of the listing table of a page as soon as they are parsed.
+
+    The listing table is the second table in the `filter_frm` form.
+    Everything outside of it is discarded while parsing,
+    and rows are discarded once the caller is done with them.
+    The rest of the page is not parsed if the caller stops early.
+    """
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    listing = None
+    form_tables = 0
+    for offset in range(0, len(data), chunk_size):
+        parser.feed(data[offset : offset + chunk_size])
+        for event, element in parser.read_events():
+            if event == "start":
+                if listing is None and element.tag == "table":
+                    parent = element.getparent()
+                    if parent is not None and parent.get("id") == "filter_frm":
+                        form_tables += 1
+                        if form_tables == 2:
+                            listing = element
+                continue
+            if listing is None:
+                element.clear()
+            elif element is listing:
+                return
+            elif element.tag == "tr" and element.getparent() is listing:
+                yield element
+                element.clear()
+                listing.remove(element)
+
+
+def get_cell_text(cell) -> str:
+    if cell.text is None and len(cell) and cell[0].tag == "b":
+        # Handle cases when classified has been enclosed in a <b>tag</b>
+        return cell[0].text
+    return cell.text
+
+
+def classified_from_row(row, ad_type: str):
+    """Return the classified in a row of the listing table, None for other rows."""
+    ad_id = row.get("id", "")[len("tr_") :]
+    links = row.xpath(f'.//a[@id="dm_{ad_id}"]')
+    if not ad_id or not links:
+        return None
+    cells = row.findall("td")
+    values = {}
+    for attribute, column in COLUMNS[ad_type].items():
+        values[attribute] = (
+            get_cell_text(cells[column - 1]) if len(cells) >= column else None
+        )
+    title = get_cell_text(links[0])
+    if ad_type == "apartment":
+        if title is None or values["street"] is None:
+            logger.warning(f"Invalid data for classified with ID: {ad_id}")
+            return None
+        classified = Apartment(title, values.pop("street"))
+        if not (values["rooms"] and values["floor"]):
+            logger.debug(f"Skipping invalid apartment: {classified}")
+            return None
+    elif ad_type == "house":
+        if title is None or values["street"] is None:
+            logger.debug(f"Skipping invalid house with ID: {ad_id}")
+            return None
+        classified = House(title, values.pop("street"))
+    elif ad_type == "dog":
+        if title is None or values["age"] is None:
+            logger.warning(f"Invalid data for dog with ID: {ad_id}")
+            return None
+        classified = Dog(title, values.pop("age"))
+    else:
+        logger.critical("Unknown classified type!")
+        sys.exit(1)
+    for attribute, value in values.items():
+        setattr(classified, attribute, value)
+    return classified
+
 
 class RSSRetriever:
     @func_log
-    def __init__(self, data_cache: lib.cache.DataCache = None):
+    def __init__(self, data_cache: lib.cache.DataCache = None, transport=None):
         self.data_cache = data_cache
+        # without a transport feedparser retrieves the feed itself
+        self.transport = transport
 
     @func_log
     def _fetch(self, url):
-        response = feedparser.parse(url)
+        if self.transport:
+            r = self.transport.get(url)
+            response = feedparser.parse(r.content)
+            response["status"] = r.status_code
+            response["headers"] = r.headers
+        else:
+            response = feedparser.parse(url)
         if self.data_cache:
             self.data_cache.add(url, response)
         return response
@@ -46,22 +164,55 @@ class RSSRetriever:
 
 
 class Retriever:
-    def __init__(self, settings: lib.settings.Settings, data_cache):
+    def __init__(self, settings: lib.settings.Settings, data_cache, transport=None):
         self.settings = settings
         self.data_cache = data_cache
+        self.transport = transport or lib.fetch.ResilientTransport.from_settings(
+            settings
+        )
+        # classifieds parsed during this run, keyed by URL and type,
+        # so that profiles tracking the same URL share one parse
+        self._parsed = {}
 
     @func_log
-    def update_data_cache(self):
-        tracking_list = self.settings.tracking_list
+    def update_data_cache(self, urls: list = None, force: bool = False):
+        """Retrieve all stale URLs, by default those in the tracking list.
+
+        With force set, fresh URLs are retrieved as well.
+        URLs that fail to be retrieved keep their stale cached data.
+        Returns the URLs that were retrieved.
+        """
+        if urls is None:
+            tracking_list = self.settings.tracking_list
+            urls = [tracking_list[item]["url"] for item in tracking_list]
 
-        for item in tracking_list:
-            url = tracking_list[item]["url"]
-            logger.info(f"Looking for type: {item}")
-            # TODO: only update cache if it is cold
+        retrieved = []
+        for url in urls:
+            logger.info(f"Updating data for URL: {url}")
+            if url in self.data_cache:
+                age = datetime.datetime.now() - self.data_cache.get_url_timestamp(url)
+                lib.metrics.DATA_CACHE_AGE.set(age.total_seconds(), url=url)
+                if self.data_cache.is_fresh(url) and not force:
+                    logger.debug(f"Cached data for {url} is still fresh")
+                    lib.metrics.DATA_CACHE_LOOKUPS.inc(result="hit")
+                    continue
+                lib.metrics.DATA_CACHE_LOOKUPS.inc(result="stale")
+            else:
+                lib.metrics.DATA_CACHE_LOOKUPS.inc(result="miss")
 
-            data = self.retrieve_ss_data(url)
+            try:
+                data = self.retrieve_ss_data(url)
+            except lib.fetch.FetchError as e:
+                lib.metrics.FETCH_FAILURES.inc(url=url)
+                if url in self.data_cache:
+                    logger.warning(f"{e}, using stale cached data")
+                else:
+                    logger.error(f"{e}, no cached data to use")
+                continue
             logger.debug(f"{url} -> {data}")
             self.data_cache.add(url, data)
+            retrieved.append(url)
+        return retrieved
 
     @func_log
     def retrieve_ss_data(self, url: str) -> object:
@@ -70,18 +221,71 @@ class Retriever:
         Retrieve the data using the URL provided.
         """
 
-        # TODO: add randomization of user agent here
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.132 Safari/537.36"
-        }
-        r = requests.get(url, headers=headers)
+        r = request_listing(self.transport, url)
+        lib.metrics.FETCH_SECONDS.observe(r.elapsed, url=url)
+        lib.metrics.FETCH_BYTES.inc(len(r.content), url=url)
+        lib.metrics.FETCH_RESPONSES.inc(url=url, status=r.status_code)
         return r.content
 
     def get_ss_data_from_cache(self, url: str) -> object:
+        """Return the listing table of the cached page, None if it has none."""
         logger.debug(f"Retrieving data from cache for URL: {url}")
         data = self.data_cache.get(url)
         tree = html.fromstring(data)
-        return tree.xpath('//*[@id="filter_frm"]/table[2]')[0]
+        tables = tree.xpath('//*[@id="filter_frm"]/table[2]')
+        return tables[0] if tables else None
+
+    def get_ads(self, url: str, ad_type: str, is_known=None) -> list:
+        """Return classifieds of the given type parsed from cached data of the URL.
+
+        Every URL is parsed only once per run.
+        With streaming_parse enabled in settings the page is parsed incrementally.
+        If stop_after_known is set as well, parsing stops after that many
+        consecutive classifieds for which is_known returns True.
+        """
+        if url not in self.data_cache:
+            # the URL could not be retrieved and there is nothing cached
+            return []
+        if (url, ad_type) not in self._parsed:
+            t_start = time.perf_counter()
+            if getattr(self.settings, "streaming_parse", False):
+                ad_list = self.get_ad_list_streaming(
+                    self.data_cache.get(url),
+                    ad_type,
+                    is_known,
+                    getattr(self.settings, "stop_after_known", None),
+                )
+            else:
+                content = self.get_ss_data_from_cache(url)
+                if content is None:
+                    logger.warning(f"Cached page of {url} has no listing table")
+                    ad_list = []
+                else:
+                    ad_list = self.get_ad_list(content, ad_type)
+            lib.metrics.PARSE_SECONDS.observe(time.perf_counter() - t_start, url=url)
+            lib.metrics.ADS_PER_PAGE.set(len(ad_list), url=url)
+            self._parsed[(url, ad_type)] = ad_list
+        return self._parsed[(url, ad_type)]
+
+    def get_ad_list_streaming(
+        self, data: bytes, ad_type: str, is_known=None, stop_after_known=None
+    ) -> list:
+        """Parse classifieds row by row, only keeping the listing table in memory."""
+        ad_list = []
+        known_in_a_row = 0
+        for row in iter_listing_rows(data):
+            classified = classified_from_row(row, ad_type)
+            if not classified:
+                continue
+            ad_list.append(classified)
+            if stop_after_known and is_known:
+                known_in_a_row = known_in_a_row + 1 if is_known(classified) else 0
+                if known_in_a_row >= stop_after_known:
+                    logger.debug(
+                        f"Stopped parsing after {known_in_a_row} known classifieds"
+                    )
+                    break
+        return ad_list
 
     def get_id_from_attrib(self, attrib):
         return attrib["id"].split("_")[1]
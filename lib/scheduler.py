@@ -0,0 +1,146 @@
+import contextlib
+import json
+import math
+import os
+import tempfile
+import time
+from loguru import logger
+from lib.cache import file_lock
+
+# weight of the history when a new observation comes in
+DECAY = 0.9
+
+
+class PollScheduler:
+    """Poll every URL at an interval that fits how often it gets new classifieds.
+
+    The arrival rate of new classifieds is estimated per URL from decayed sums
+    of new classifieds seen and time passed between polls. Intervals follow the
+    square root rule: polling each URL at an interval proportional to
+    1 / sqrt(rate) gives the fewest requests for a given average detection
+    latency. The constant is picked so that the expected latency, weighted by
+    the number of classifieds, equals target_latency. Intervals are then
+    clamped to [min_interval, max_interval] and stretched if the request budget
+    would be exceeded.
+    State is kept in a JSON file, so the statistics persist across runs.
+    When shared by several workers, saving merges the statistics of the URLs
+    this process polled into what the others saved.
+    """
+
+    def __init__(
+        self,
+        state_file: str,
+        target_latency: float = 1800,
+        min_interval: float = 300,
+        max_interval: float = 86400,
+        max_requests_per_hour: float = None,
+        shared: bool = False,
+    ):
+        self.state_file = state_file
+        self.target_latency = target_latency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_requests_per_hour = max_requests_per_hour
+        self.shared = shared
+        # URLs observed since the state was loaded or last saved
+        self._observed = set()
+        self.state = {}
+        if os.path.exists(state_file):
+            lock = file_lock(state_file, shared=True)
+            with lock if shared else contextlib.nullcontext():
+                self.state = self._read()
+
+    def _read(self) -> dict:
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a scheduler configured by the `scheduler` settings, None if not set."""
+        if not settings.scheduler:
+            return None
+        config = settings.scheduler
+        return cls(
+            config.get("state_file", "scheduler.json"),
+            config.get("target_latency", 1800),
+            config.get("min_interval", 300),
+            config.get("max_interval", 86400),
+            config.get("max_requests_per_hour"),
+            shared=bool(getattr(settings, "shared_cache", False)),
+        )
+
+    def rate(self, url: str) -> float:
+        """Return the estimated number of new classifieds per second."""
+        stats = self.state.get(url)
+        if not stats or not stats["seconds"]:
+            # no history yet, assume one new classified per target latency
+            return 1 / self.target_latency
+        return stats["new"] / stats["seconds"]
+
+    def intervals(self, urls: list) -> dict:
+        """Return the poll interval in seconds for each URL."""
+        if not urls:
+            return {}
+        # URLs that never get anything new are treated as getting one
+        # classified per max_interval, so that the math stays finite
+        floor = 1 / self.max_interval
+        rates = {url: max(self.rate(url), floor) for url in urls}
+        scale = (
+            2
+            * self.target_latency
+            * sum(rates.values())
+            / sum(math.sqrt(r) for r in rates.values())
+        )
+        intervals = {
+            url: min(max(scale / math.sqrt(rate), self.min_interval), self.max_interval)
+            for url, rate in rates.items()
+        }
+        if self.max_requests_per_hour:
+            requests_per_hour = sum(3600 / i for i in intervals.values())
+            if requests_per_hour > self.max_requests_per_hour:
+                stretch = requests_per_hour / self.max_requests_per_hour
+                intervals = {url: i * stretch for url, i in intervals.items()}
+        return intervals
+
+    def due(self, urls: list, now: float = None) -> list:
+        """Return the URLs that should be polled now."""
+        now = time.time() if now is None else now
+        intervals = self.intervals(urls)
+        due = []
+        for url in urls:
+            last_poll = self.state.get(url, {}).get("last_poll")
+            if last_poll is None or now - last_poll >= intervals[url]:
+                due.append(url)
+            else:
+                logger.debug(
+                    f"{url} not due for {intervals[url] - (now - last_poll):.0f} seconds"
+                )
+        return due
+
+    def observe(self, url: str, new_count: int, now: float = None) -> None:
+        """Record how many new classifieds were found when polling the URL."""
+        now = time.time() if now is None else now
+        stats = self.state.setdefault(
+            url, {"new": 0.0, "seconds": 0.0, "last_poll": None}
+        )
+        # the first poll finds everything listed so far, which says nothing about the rate
+        if stats["last_poll"] is not None:
+            stats["new"] = stats["new"] * DECAY + new_count
+            stats["seconds"] = stats["seconds"] * DECAY + (now - stats["last_poll"])
+        stats["last_poll"] = now
+        self._observed.add(url)
+
+    def save(self) -> None:
+        """Write the state atomically, merging with what other processes saved if shared."""
+        lock = file_lock(self.state_file)
+        with lock if self.shared else contextlib.nullcontext():
+            if self.shared and os.path.exists(self.state_file):
+                state = self._read()
+                state.update({url: self.state[url] for url in self._observed})
+                self.state = state
+            directory = os.path.dirname(os.path.abspath(self.state_file))
+            fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_name, self.state_file)
+            self._observed = set()
@@ -0,0 +1,198 @@
+import array
+import contextlib
+import heapq
+import math
+import os
+import re
+import unicodedata
+from loguru import logger
+from lib.cache import Cache, cache_key, file_lock
+
+# common Latvian noun and adjective endings after folding diacritics,
+# longest first, so that "kamīns", "kamīna" and "kamīnu" are the same term
+SUFFIXES = (
+    "ajiem",
+    "ajam",
+    "ajai",
+    "iem",
+    "am",
+    "as",
+    "os",
+    "is",
+    "us",
+    "es",
+    "em",
+    "im",
+    "um",
+    "ai",
+    "ei",
+    "a",
+    "e",
+    "i",
+    "o",
+    "u",
+    "s",
+)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def fold(text: str) -> str:
+    """Lowercase the text and drop diacritics, "Ķīpsala" becomes "kipsala"."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(term: str) -> str:
+    for suffix in SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[: -len(suffix)]
+    return term
+
+
+def terms(text: str) -> list:
+    """Return the normalized terms of a text."""
+    return [stem(t) for t in re.findall(r"\w+", fold(text))]
+
+
+class SearchIndex:
+    """Inverted index over the titles and descriptions of classifieds.
+
+    Every classified is a document, numbered in the order it was added.
+    Postings of a term are kept as arrays of document numbers and term counts,
+    which keeps the index small on disk and quick to load.
+    Results are ranked with BM25.
+    """
+
+    def __init__(self, file_name: str, shared: bool = False):
+        self.file_name = file_name
+        self.shared = shared
+        self._new_documents = []
+        self._create()
+        if os.path.exists(file_name):
+            lock = file_lock(file_name, shared=True)
+            with lock if shared else contextlib.nullcontext():
+                self._load(Cache._read_file(file_name))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return the index configured by `search_index`, None if it is not set."""
+        if not getattr(settings, "search_index", None):
+            return None
+        return cls(
+            settings.search_index, bool(getattr(settings, "shared_cache", False))
+        )
+
+    def _create(self) -> None:
+        # per document
+        self.hashes = []
+        self.titles = []
+        self.categories = []
+        self.lengths = array.array("I")
+        self.total_length = 0
+        self.documents = {}
+        # term -> (document numbers, term counts)
+        self.postings = {}
+
+    def _load(self, data: dict) -> None:
+        self.hashes = data["hashes"]
+        self.titles = data["titles"]
+        self.categories = data["categories"]
+        self.lengths = data["lengths"]
+        self.postings = data["postings"]
+        self.total_length = sum(self.lengths)
+        self.documents = {key: n for n, key in enumerate(self.hashes)}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, classified) -> bool:
+        return cache_key(classified) in self.documents
+
+    def add(self, classified) -> bool:
+        """Index a classified, return False if it was indexed already."""
+        key = cache_key(classified)
+        if key in self.documents:
+            return False
+        category = type(classified).__name__.lower()
+        text = f"{classified.title} {getattr(classified, 'description', None) or ''}"
+        self._add_document(key, classified.title, category, terms(text))
+        self._new_documents.append((key, classified.title, category, text))
+        return True
+
+    def _add_document(self, key, title, category, document_terms) -> None:
+        n = len(self.hashes)
+        self.hashes.append(key)
+        self.titles.append(title)
+        self.categories.append(category)
+        self.lengths.append(len(document_terms))
+        self.total_length += len(document_terms)
+        self.documents[key] = n
+        counts = {}
+        for term in document_terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            if term not in self.postings:
+                self.postings[term] = (array.array("I"), array.array("I"))
+            documents, term_counts = self.postings[term]
+            documents.append(n)
+            term_counts.append(count)
+
+    def update(self, classifieds) -> int:
+        """Index the classifieds that are not indexed yet, return how many were added."""
+        return sum(self.add(c) for c in classifieds if hasattr(c, "hash"))
+
+    def search(self, query: str, limit: int = 20, category: str = None) -> list:
+        """Return up to limit (score, hash, title, category) tuples, best first.
+
+        A classified matches if it has any of the query terms,
+        those having more and rarer terms rank higher.
+        """
+        if not self.hashes:
+            return []
+        average_length = self.total_length / len(self.lengths) or 1
+        scores = {}
+        for term in set(terms(query)):
+            if term not in self.postings:
+                continue
+            documents, term_counts = self.postings[term]
+            idf = math.log(
+                1 + (len(self.hashes) - len(documents) + 0.5) / (len(documents) + 0.5)
+            )
+            for n, count in zip(documents, term_counts):
+                norm = K1 * (1 - B + B * self.lengths[n] / average_length)
+                scores[n] = scores.get(n, 0) + idf * count * (K1 + 1) / (count + norm)
+        if category:
+            scores = {n: s for n, s in scores.items() if self.categories[n] == category}
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [
+            (score, self.hashes[n], self.titles[n], self.categories[n])
+            for n, score in best
+        ]
+
+    def save(self) -> None:
+        """Save the index, merging with what other processes saved if shared."""
+        if not self._new_documents and os.path.exists(self.file_name):
+            return
+        lock = file_lock(self.file_name)
+        with lock if self.shared else contextlib.nullcontext():
+            if self.shared and os.path.exists(self.file_name):
+                new_documents = self._new_documents
+                self._load(Cache._read_file(self.file_name))
+                for key, title, category, text in new_documents:
+                    if key not in self.documents:
+                        self._add_document(key, title, category, terms(text))
+            Cache._write_file(
+                self.file_name,
+                {
+                    "hashes": self.hashes,
+                    "titles": self.titles,
+                    "categories": self.categories,
+                    "lengths": self.lengths,
+                    "postings": self.postings,
+                },
+            )
+            self._new_documents = []
+        logger.debug(f"Search index saved to file: {self.file_name}")
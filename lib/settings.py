@@ -1,4 +1,5 @@
 import json
+import zlib
 
 import os
 
@@ -6,6 +7,7 @@ import os
 class Settings:
     def __init__(self, settings_file_name: str = "settings.json"):
         self.settings_file_name = settings_file_name
+        self.name = "default"
         if not self._settings_file_exists():
             raise RuntimeError("Settings file is missing")
         self._load_settings_from_file()
@@ -16,6 +18,22 @@ class Settings:
         self.local_cache: str = None
         self.data_cache: str = None
         self.cache_validity_time: int = None
+        self.shared_cache: bool = None
+        self.cache_retention_days: int = None
+        self.cache_retention_count: int = None
+        self.cache_bloom_error_rate: float = None
+        self.metrics_file: str = None
+        self.scheduler: dict = None
+        self.streaming_parse: bool = None
+        self.stop_after_known: int = None
+        self.repost_threshold: float = None
+        self.price_archive: str = None
+        self.fetch: dict = None
+        self.identities: dict = None
+        self.logging: dict = None
+        self.search_index: str = None
+        self.keyword_alerts: list = None
+        self.comparables: int = None
         self.tracking_list: dict = None
 
         self._parse_settings()
@@ -39,8 +57,52 @@ class Settings:
             raise TypeError(
                 "Cache validity time in settings is either missing or invalid."
             )
+        self.shared_cache = bool(self._get_setting("shared_cache"))
+        self.cache_retention_days = self._get_setting("cache_retention_days")
+        self.cache_retention_count = self._get_setting("cache_retention_count")
+        self.cache_bloom_error_rate = self._get_setting("cache_bloom_error_rate")
+        self.metrics_file = self._get_setting("metrics_file")
+        self.scheduler = self._get_setting("scheduler")
+        self.streaming_parse = bool(self._get_setting("streaming_parse"))
+        self.stop_after_known = self._get_setting("stop_after_known")
+        self.repost_threshold = self._get_setting("repost_threshold")
+        self.price_archive = self._get_setting("price_archive")
+        self.fetch = self._get_setting("fetch")
+        self.identities = self._get_setting("identities")
+        self.logging = self._get_setting("logging")
+        self.search_index = self._get_setting("search_index")
+        self.keyword_alerts = self._get_setting("keyword_alerts")
+        self.comparables = self._get_setting("comparables")
         self.tracking_list = self._get_setting("tracking_list")
 
+    def get_profiles(self) -> list:
+        """Return settings for every profile.
+
+        Without a `profiles` section the settings themselves are the only profile.
+        """
+        profiles = self._get_setting("profiles")
+        if not profiles:
+            return [self]
+        return [Profile(self, name, profile) for name, profile in profiles.items()]
+
+    def shard_tracking_list(self, worker_id: int, workers: int) -> None:
+        """Keep only the part of the tracking list this worker is responsible for.
+
+        Entries are assigned to workers by a stable hash of their URL,
+        so every worker process computes the same split.
+        Several workers always share the cache files, so shared cache mode is enabled.
+        """
+        if workers <= 1:
+            return
+        if not 0 <= worker_id < workers:
+            raise ValueError(f"Worker id must be between 0 and {workers - 1}")
+        self.tracking_list = {
+            name: entry
+            for name, entry in (self.tracking_list or {}).items()
+            if zlib.crc32(entry["url"].encode("utf-8")) % workers == worker_id
+        }
+        self.shared_cache = True
+
     def _load_settings_from_file(self):
         with open(self.settings_file_name) as settings_file_handle:
             self._settings_dict = json.load(settings_file_handle)
@@ -49,14 +111,51 @@ class Settings:
         return os.path.exists(self.settings_file_name)
 
 
+class Profile(Settings):
+    """Settings of a single profile.
+
+    Keys of the profile override the top level settings.
+    Unless the profile sets its own `local_cache`, it gets a cache file
+    named after the profile, as the seen classifieds differ per profile.
+    """
+
+    def __init__(self, settings: Settings, name: str, profile: dict):
+        self.settings_file_name = settings.settings_file_name
+        self.name = name
+        self._settings_dict = dict(settings._settings_dict)
+        del self._settings_dict["profiles"]
+        self._settings_dict.update(profile)
+        if "local_cache" not in profile and settings.local_cache:
+            base, extension = os.path.splitext(settings.local_cache)
+            self._settings_dict["local_cache"] = f"{base}.{name}{extension}"
+        self._parse_settings()
+
+
 class TestSettings(Settings):
     """Dummy Settings class meant for Unittesting purposes."""
 
     def __init__(self, local_cache=None):
+        self.name = "test"
         self.pushover_enabled: bool = None
         self.pushover_user_key: str = None
         self.pushover_api_token: str = None
         self.local_cache: str = local_cache
         self.data_cache: str = None
         self.cache_validity_time: int = None
+        self.shared_cache: bool = False
+        self.cache_retention_days: int = None
+        self.cache_retention_count: int = None
+        self.cache_bloom_error_rate: float = None
+        self.metrics_file: str = None
+        self.scheduler: dict = None
+        self.streaming_parse: bool = False
+        self.stop_after_known: int = None
+        self.repost_threshold: float = None
+        self.price_archive: str = None
+        self.fetch: dict = None
+        self.identities: dict = None
+        self.logging: dict = None
+        self.search_index: str = None
+        self.keyword_alerts: list = None
+        self.comparables: int = None
         self.tracking_list: dict = None
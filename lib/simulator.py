@@ -0,0 +1,261 @@
+import html
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+STREETS = [
+    "Brīvības",
+    "Zemitāna",
+    "Ropažu",
+    "Tērbatas",
+    "Lāčplēša",
+    "Gertrūdes",
+    "Čaka",
+    "Stabu",
+    "Avotu",
+    "Deglava",
+    "Krasta",
+    "Kalnciema",
+]
+SERIES = [
+    "Staļina",
+    "Hrušč.",
+    "602.",
+    "119.",
+    "LT proj.",
+    "Jaunb.",
+    "P. kara",
+    "Renov.",
+]
+WORDS = [
+    "gaišs",
+    "plašs",
+    "renovēts",
+    "kluss",
+    "siltināts",
+    "dzīvoklis",
+    "ar",
+    "balkonu",
+    "kamīnu",
+    "skatu",
+    "uz",
+    "parku",
+    "centra",
+    "tuvumā",
+    "pārdod",
+    "īpašnieks",
+    "jauns",
+    "remonts",
+]
+BREEDS = ["buldogs", "kucēns", "taksis", "terjers", "ar", "ciltsrakstiem", "pārdod"]
+
+# columns after the checkbox, image and title columns, as on ss.com
+HEADERS = {
+    "apartment": ["Iela", "Ist.", "m2", "Stāvs", "Sērija", "Cena, m2", "Cena"],
+    "house": ["Iela", "m2", "Stāvi", "Ist.", "Zeme", "Cena"],
+    "dog": ["Vecums", "Cena"],
+}
+
+
+def format_price(value: int) -> str:
+    return f"{value:,}  €"
+
+
+class SimulatedSite:
+    """Generate ss.com-like listings that change over time.
+
+    Every category has `pages` pages of `ads_per_page` classifieds, newest first.
+    Every tick() replaces a `churn` share of them with new classifieds
+    at the top of the first page. Some classifieds are highlighted,
+    which wraps their cells in <b> tags, and banner rows are mixed in.
+    """
+
+    def __init__(
+        self,
+        ads_per_page: int = 30,
+        pages: int = 10,
+        churn: float = 0.05,
+        categories=("apartment", "house", "dog"),
+        seed: int = 0,
+    ):
+        self.ads_per_page = ads_per_page
+        self.pages = pages
+        self.churn = churn
+        self.random = random.Random(seed)
+        self.next_id = 50000000
+        self.lock = threading.Lock()
+        self.ads = {
+            category: [self.new_ad(category) for _ in range(ads_per_page * pages)]
+            for category in categories
+        }
+
+    def new_ad(self, category: str) -> dict:
+        rng = self.random
+        self.next_id += 1
+        words = BREEDS if category == "dog" else WORDS
+        ad = {
+            "id": self.next_id,
+            "title": " ".join(rng.choices(words, k=rng.randint(4, 12))).capitalize(),
+            "highlighted": rng.random() < 0.1,
+        }
+        if category == "apartment":
+            rooms = rng.randint(1, 5)
+            space = rng.randint(20, 40) + rooms * 20
+            floors = rng.randint(2, 12)
+            price_per_m = rng.randint(600, 2500)
+            ad["cells"] = [
+                f"{rng.choice(STREETS)} {rng.randint(1, 150)}",
+                str(rooms),
+                str(space),
+                f"{rng.randint(1, floors)}/{floors}",
+                rng.choice(SERIES),
+                f"{price_per_m:,} €",
+                format_price(price_per_m * space),
+            ]
+        elif category == "house":
+            space = rng.randint(60, 400)
+            ad["cells"] = [
+                f"{rng.choice(STREETS)} {rng.randint(1, 150)}",
+                str(space),
+                str(rng.randint(1, 3)),
+                str(rng.randint(2, 10)),
+                f"{rng.randint(300, 3000)} m²",
+                format_price(space * rng.randint(500, 2000)),
+            ]
+        else:
+            ad["cells"] = [
+                f"{rng.randint(1, 11)} mēn.",
+                format_price(rng.randint(100, 2000)),
+            ]
+        return ad
+
+    def tick(self) -> int:
+        """Post new classifieds and drop the oldest ones, return how many changed."""
+        changed = 0
+        with self.lock:
+            for category, ads in self.ads.items():
+                count = round(len(ads) * self.churn)
+                new = [self.new_ad(category) for _ in range(count)]
+                self.ads[category] = new + ads[: len(ads) - count]
+                changed += count
+        return changed
+
+    @staticmethod
+    def url_path(category: str, page: int = 1) -> str:
+        if page == 1:
+            return f"/lv/{category}/"
+        return f"/lv/{category}/page{page}.html"
+
+    def render_row(self, category: str, ad: dict) -> str:
+        ad_id = ad["id"]
+        href = f"/msg/lv/{category}/{ad_id}.html"
+
+        def wrap(text):
+            text = html.escape(text)
+            return f"<b>{text}</b>" if ad["highlighted"] else text
+
+        cells = "".join(f'<td class="msga2-o pp6">{wrap(c)}</td>' for c in ad["cells"])
+        return (
+            f'<tr id="tr_{ad_id}">'
+            f'<td class="msga2 pp0"><input type="checkbox" id="c{ad_id}"></td>'
+            f'<td class="msga2"><a href="{href}"><img class="isfoto"></a></td>'
+            f'<td class="msg2"><div class="d1"><a id="dm_{ad_id}" class="am" href="{href}">'
+            f"{wrap(ad['title'])}</a></div></td>"
+            f"{cells}</tr>\n"
+        )
+
+    def render_page(self, category: str, page: int) -> bytes:
+        """Return the HTML of a listing page, None if there is no such page."""
+        if category not in self.ads or not 1 <= page <= self.pages:
+            return None
+        with self.lock:
+            start = (page - 1) * self.ads_per_page
+            ads = self.ads[category][start : start + self.ads_per_page]
+        header = "".join(
+            f'<td class="msg_column_td">{name}</td>' for name in HEADERS[category]
+        )
+        rows = [
+            f'<tr id="head_line"><td class="msg_column" colspan="3">Sludinājumi</td>{header}</tr>\n'
+        ]
+        for n, ad in enumerate(ads, 1):
+            rows.append(self.render_row(category, ad))
+            if n % 10 == 0:
+                rows.append(f'<tr id="tr_bnr_{n}"><td colspan="10">banner</td></tr>\n')
+        navigation = " ".join(
+            f'<a class="navi" href="{self.url_path(category, n)}">{n}</a>'
+            for n in range(1, self.pages + 1)
+        )
+        return (
+            "<html><head>"
+            '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+            "<title>SS.COM</title></head><body>\n"
+            f'<form id="filter_frm" method="post" action="/lv/{category}/filter/">\n'
+            "<table><caption>Filter</caption></table>\n"
+            '<table border="0" cellpadding="2" cellspacing="0" width="100%">\n'
+            f"{''.join(rows)}</table>\n"
+            f'<div class="td2">{navigation}</div>\n'
+            "</form></body></html>\n"
+        ).encode("utf-8")
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """Serve the pages of a SimulatedSite, after the configured latency."""
+
+    site = None
+    latency = 0
+    path_pattern = re.compile(r"^/lv/(\w+)/(?:page(\d+)\.html)?$")
+
+    def do_GET(self):
+        if self.latency:
+            # spread the latency like a real server, but never below half of it
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        match = self.path_pattern.match(self.path)
+        body = None
+        if match:
+            body = self.site.render_page(match.group(1), int(match.group(2) or 1))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.trace(format % args)
+
+
+class SimulatorServer:
+    """Serve a simulated site over HTTP from a background thread."""
+
+    def __init__(
+        self,
+        site: SimulatedSite,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+    ):
+        handler = type(
+            "Handler", (SimulatorRequestHandler,), {"site": site, "latency": latency}
+        )
+        self.site = site
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, category: str, page: int = 1) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{self.site.url_path(category, page)}"
+
+    def start(self) -> None:
+        logger.info(f"Serving simulated ss.com on port {self.port}")
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
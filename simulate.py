@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Run the tracker against a simulated ss.com and report its throughput.
+#
+import json
+import os
+import tempfile
+import time
+import click
+import lib.settings
+import lib.simulator
+from lib.log import set_up_logging
+from tracker import Tracker
+
+
+def write_settings(directory: str, server, categories, pages: int, **extra) -> str:
+    """Write settings with one profile per page, every profile tracking all categories."""
+    profiles = {
+        f"page{page}": {
+            "local_cache": os.path.join(directory, f"cache.page{page}.db"),
+            "tracking_list": {
+                category: {"url": server.url(category, page), "filter_room_count": 3}
+                for category in categories
+            },
+        }
+        for page in range(1, pages + 1)
+    }
+    settings = {
+        "pushover_enabled": False,
+        "pushover_user_key": "",
+        "pushover_api_token": "",
+        "local_cache": os.path.join(directory, "cache.db"),
+        "data_cache": os.path.join(directory, "data_cache.db"),
+        "cache_validity_time": 0,
+        "profiles": profiles,
+        **extra,
+    }
+    settings_file = os.path.join(directory, "settings.json")
+    with open(settings_file, "w") as f:
+        json.dump(settings, f, indent=2)
+    return settings_file
+
+
+@click.command()
+@click.option("--debug", is_flag=True, default=False, help="Print DEBUG log to screen")
+@click.option("--ads-per-page", default=30, help="Classifieds on every page")
+@click.option("--pages", default=10, help="Pages per category, each one tracked")
+@click.option(
+    "--category",
+    "categories",
+    multiple=True,
+    default=["apartment", "house", "dog"],
+    help="Categories to simulate, can be given several times",
+)
+@click.option(
+    "--churn", default=0.05, help="Share of classifieds replaced between cycles"
+)
+@click.option("--latency", default=0.0, help="Average response time in seconds")
+@click.option("--cycles", default=3, help="Tracker cycles to run")
+@click.option(
+    "--streaming-parse/--no-streaming-parse",
+    default=False,
+    help="Use the streaming parser",
+)
+def main(
+    debug,
+    ads_per_page,
+    pages,
+    categories,
+    churn,
+    latency,
+    cycles,
+    streaming_parse,
+):
+    """Run tracker cycles against a simulated ss.com and print their throughput."""
+    site = lib.simulator.SimulatedSite(ads_per_page, pages, churn, categories)
+    server = lib.simulator.SimulatorServer(site, latency=latency)
+    server.start()
+    with tempfile.TemporaryDirectory() as directory:
+        set_up_logging(debug, os.path.join(directory, "tracker.log"))
+        settings_file = write_settings(
+            directory, server, categories, pages, streaming_parse=streaming_parse
+        )
+        settings = lib.settings.Settings(settings_file)
+        tracker = Tracker(
+            settings, settings.get_profiles(), print=False, force_update=True
+        )
+        click.echo("cycle  seconds  pages/s  ads/s  new ads")
+        try:
+            for cycle in range(1, cycles + 1):
+                t_start = time.perf_counter()
+                all_results = tracker.run_cycle()
+                tracker.save()
+                seconds = time.perf_counter() - t_start
+                ads = new = 0
+                for results in all_results.values():
+                    for result in results.values():
+                        ads += len(result["new"]) + len(result["old"])
+                        new += len(result["new"])
+                page_count = pages * len(categories)
+                click.echo(
+                    f"{cycle:5d}  {seconds:7.2f}  {page_count / seconds:7.1f}"
+                    f"  {ads / seconds:5.0f}  {new:7d}"
+                )
+                site.tick()
+        finally:
+            server.stop()
+            # caches save themselves when destroyed, that has to happen before
+            # the directory is removed
+            del tracker
+
+
+if __name__ == "__main__":
+    main()
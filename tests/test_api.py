@@ -0,0 +1,128 @@
+import gzip
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import lib.api
+import lib.datastructures
+
+
+def make_apartment(title, street, rooms, price):
+    apartment = lib.datastructures.Apartment(title, street)
+    apartment.rooms = rooms
+    apartment.floor = "1/5"
+    apartment.price = price
+    return apartment
+
+
+@pytest.fixture
+def index():
+    index = lib.api.ClassifiedIndex()
+    old = make_apartment("Old flat", "Zemitāna 9", "2", "50,000 €")
+    index.add_history([old, "not a classified"], "anna")
+    results = {
+        "apartment": {
+            "new": [
+                make_apartment("Nice flat with kamīns", "Ropažu 10", "3", "90,000 €")
+            ],
+            "old": [make_apartment("Big flat", "Brīvības 214", "4", "149,000 €")],
+        }
+    }
+    index.update(results, "anna")
+    return index
+
+
+@pytest.fixture
+def server(index):
+    server = lib.api.ApiServer(index, host="127.0.0.1", port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(server, path, headers=None):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}{path}", headers=headers or {}
+    )
+    return urllib.request.urlopen(request)
+
+
+def test_index_query(index):
+    assert len(index.query({})) == 3
+    assert len(index.query({"current": "true"})) == 2
+    assert [r["title"] for r in index.query({"status": "new"})] == [
+        "Nice flat with kamīns"
+    ]
+    assert [r["title"] for r in index.query({"q": "KAMĪNS"})] == [
+        "Nice flat with kamīns"
+    ]
+    assert len(index.query({"min_rooms": "3"})) == 2
+    assert [r["title"] for r in index.query({"max_price": "60000"})] == ["Old flat"]
+    assert [r["title"] for r in index.query({"street": "ropažu"})] == [
+        "Nice flat with kamīns"
+    ]
+
+
+def test_index_update_moves_classifieds_to_history(index):
+    index.update({"apartment": {"new": [], "old": []}}, "anna")
+    assert index.query({"current": "true"}) == []
+
+
+def test_list_classifieds(server):
+    response = get(server, "/classifieds?min_rooms=3&limit=1")
+    data = json.loads(response.read())
+    assert data["total"] == 2
+    assert len(data["classifieds"]) == 1
+
+
+def test_get_classified(server, index):
+    record = index.query({"q": "Big"})[0]
+    response = get(server, f"/classifieds/{record['hash']}")
+    assert json.loads(response.read())["title"] == "Big flat"
+    with pytest.raises(urllib.error.HTTPError) as e:
+        get(server, "/classifieds/unknown")
+    assert e.value.code == 404
+
+
+def test_etag(server, index, monkeypatch):
+    response = get(server, "/classifieds?min_rooms=3&limit=1")
+    etag = response.headers["ETag"]
+    assert etag.startswith("W/")
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    def query(params):
+        raise AssertionError("the response should not be built")
+
+    # parameters in another order ask for the same response
+    with monkeypatch.context() as m:
+        m.setattr(index, "query", query)
+        with pytest.raises(urllib.error.HTTPError) as e:
+            get(server, "/classifieds?limit=1&min_rooms=3", {"If-None-Match": etag})
+    assert e.value.code == 304
+    index.add_history([make_apartment("New flat", "Avotu 1", "3", "1 €")], "anna")
+    response = get(server, "/classifieds?min_rooms=3&limit=1", {"If-None-Match": etag})
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_gzip(server, index):
+    index.add_history(
+        [make_apartment(f"Flat {i}", "Street", "2", "1 €") for i in range(50)],
+        "anna",
+    )
+    response = get(server, "/classifieds", {"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.read()))["total"] == 53
+
+
+def test_get_by_profile(index):
+    flat = make_apartment("Shared flat", "Avotu 1", "2", "70,000 €")
+    index.add_history([flat], "janis")
+    index.update({"apartment": {"new": [flat], "old": []}}, "anna")
+    assert index.get(flat.hash, "janis")["status"] == "old"
+    assert index.get(flat.hash, "anna")["status"] == "new"
+    assert index.get(flat.hash)["profile"] == "janis"
+    assert index.get("unknown") is None
+    assert [r["title"] for r in index.query({"profile": "janis"})] == ["Shared flat"]
@@ -0,0 +1,61 @@
+import math
+
+import lib.archive
+import lib.datastructures
+
+
+def make_apartment(title, street, price, price_per_m="1,000 €"):
+    apartment = lib.datastructures.Apartment(title, street)
+    apartment.rooms = "2"
+    apartment.space = "50"
+    apartment.price = price
+    apartment.price_per_m = price_per_m
+    return apartment
+
+
+def test_price_series(tmp_path):
+    archive = lib.archive.PriceArchive(str(tmp_path))
+    flat = make_apartment("Flat", "Tērbatas 1", "90,000  €")
+    other = make_apartment("Other flat", "Tērbatas 1", "50,000  €")
+    archive.append([flat, other], timestamp=100)
+    flat.price = "85,000  €"
+    archive.append([flat], timestamp=200)
+    assert len(archive) == 3
+    assert archive.price_series(flat.hash) == [(100, 90000), (200, 85000)]
+    assert archive.price_series(other.hash, "space") == [(100, 50)]
+
+
+def test_missing_values_are_nan(tmp_path):
+    archive = lib.archive.PriceArchive(str(tmp_path))
+    flat = make_apartment("Flat", "Tērbatas 1", None)
+    archive.append([flat], timestamp=100)
+    assert math.isnan(archive.price_series(flat.hash)[0][1])
+
+
+def test_street_medians_use_latest_observation(tmp_path):
+    archive = lib.archive.PriceArchive(str(tmp_path))
+    flat = make_apartment("Flat", "Tērbatas 1", "1 €", "3,000 €")
+    archive.append(
+        [
+            flat,
+            make_apartment("Second", "Tērbatas 1", "1 €", "1,000 €"),
+            make_apartment("Third", "Tērbatas 1", "1 €", "2,000 €"),
+            make_apartment("Elsewhere", "Lāčplēša 2", "1 €", "500 €"),
+        ],
+        timestamp=100,
+    )
+    flat.price_per_m = "1,500 €"
+    archive.append([flat], timestamp=200)
+    assert archive.street_medians() == {"Tērbatas 1": 1500, "Lāčplēša 2": 500}
+    assert archive.street_medians(since=150) == {"Tērbatas 1": 1500}
+
+
+def test_interrupted_append_is_ignored(tmp_path):
+    archive = lib.archive.PriceArchive(str(tmp_path))
+    archive.append([make_apartment("Flat", "Tērbatas 1", "1 €")], timestamp=100)
+    # a row written to one column only, and half of a value
+    with open(archive.column_file("ad"), "ab") as column_file:
+        column_file.write(b"\x01" * 12)
+    assert len(archive) == 1
+    with archive.columns() as columns:
+        assert len(columns["ad"]) == len(columns["price"]) == 1
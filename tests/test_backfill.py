@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+import lib.backfill
+import lib.cache
+import lib.fetch
+import lib.retriever
+import lib.settings
+import lib.simulator
+
+
+class CountingTransport(lib.fetch.HttpTransport):
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+        self.headers = []
+
+    def get(self, url, headers=None, proxy=None):
+        self.urls.append(url)
+        self.headers.append(headers)
+        return super().get(url, headers, proxy)
+
+
+@pytest.fixture
+def server():
+    site = lib.simulator.SimulatedSite(ads_per_page=10, pages=6, seed=2)
+    server = lib.simulator.SimulatorServer(site)
+    server.start()
+    yield server
+    server.stop()
+
+
+def make_cache(tmp_path):
+    return lib.cache.Cache(lib.settings.TestSettings(str(tmp_path / "cache.db")))
+
+
+def test_page_url():
+    url = "https://www.ss.com/lv/animals/dogs/"
+    assert lib.backfill.page_url(url, 1) == url
+    assert lib.backfill.page_url(url, 3) == f"{url}page3.html"
+    assert lib.backfill.page_url(f"{url}page2.html", 4) == f"{url}page4.html"
+
+
+def test_backfill_all_pages(server, tmp_path):
+    cache = make_cache(tmp_path)
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    transport = CountingTransport()
+    crawler = lib.backfill.Backfill(transport, journal, concurrency=3)
+    url = server.url("apartment")
+    added = crawler.run(url, "apartment", [cache])
+    assert len(transport.urls) == 6
+    assert added == len(cache.cache) == 60
+    # requested with the same headers as polling
+    assert transport.headers == [lib.retriever.HEADERS] * 6
+    assert journal.is_done(cache, url, 6)
+    # the journal survives a restart and nothing is crawled again
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    transport = CountingTransport()
+    assert lib.backfill.Backfill(transport, journal).run(url, "apartment", [cache]) == 0
+    assert transport.urls == []
+
+
+def test_backfill_resumes(server, tmp_path):
+    url = server.url("apartment")
+    cache = make_cache(tmp_path)
+    with open(tmp_path / "journal", "w") as f:
+        for page in (1, 2, 3):
+            entry = {
+                "caches": [cache.local_cache],
+                "url": url,
+                "page": page,
+                "last_page": 6,
+                "ads": 0,
+                "sample": [],
+            }
+            f.write(json.dumps(entry) + "\n")
+        # a line cut short by a crash
+        f.write('{"url": "')
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    transport = CountingTransport()
+    crawler = lib.backfill.Backfill(transport, journal, checkpoint_every=2)
+    assert crawler.run(url, "apartment", [cache]) > 0
+    assert sorted(transport.urls) == [server.url("apartment", p) for p in (4, 5, 6)]
+
+
+def test_new_and_reset_caches_are_backfilled_again(server, tmp_path):
+    url = server.url("dog")
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    lib.backfill.Backfill(CountingTransport(), journal).run(
+        url, "dog", [make_cache(tmp_path)]
+    )
+    # another profile starts tracking the same search
+    other = lib.cache.Cache(lib.settings.TestSettings(str(tmp_path / "other.db")))
+    transport = CountingTransport()
+    assert lib.backfill.Backfill(transport, journal).run(url, "dog", [other]) > 0
+    assert len(transport.urls) == 6
+    # the first cache is deleted
+    (tmp_path / "cache.db").unlink()
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    transport = CountingTransport()
+    crawler = lib.backfill.Backfill(transport, journal)
+    assert crawler.run(url, "dog", [make_cache(tmp_path)]) > 0
+    assert len(transport.urls) == 6
+
+
+def test_restart(server, tmp_path):
+    url = server.url("dog")
+    cache = make_cache(tmp_path)
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    lib.backfill.Backfill(CountingTransport(), journal, max_pages=2).run(
+        url, "dog", [cache]
+    )
+    transport = CountingTransport()
+    crawler = lib.backfill.Backfill(transport, journal, max_pages=2)
+    crawler.run(url, "dog", [cache], restart=True)
+    assert len(transport.urls) == 2
+    # the restart is in the journal, its progress replaces the earlier one
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    assert journal.is_done(cache, url, 2)
+
+
+def test_failed_pages_are_not_journaled(server, tmp_path):
+    url = server.url("dog")
+    cache = make_cache(tmp_path)
+    journal = lib.backfill.BackfillJournal(str(tmp_path / "journal"))
+    crawler = lib.backfill.Backfill(CountingTransport(), journal, max_pages=2)
+    # pages of an unknown category are not found
+    crawler.run(server.url("cat"), "dog", [cache])
+    assert crawler.failed == [(server.url("cat"), 1)]
+    assert not journal.is_done(cache, server.url("cat"), 1)
+    crawler.run(url, "dog", [cache])
+    assert journal.is_done(cache, url, 2) and not journal.is_done(cache, url, 3)
@@ -0,0 +1,35 @@
+import pytest
+
+import lib.bloom
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = lib.bloom.BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"key {i}")
+    assert all(f"key {i}" in bloom for i in range(1000))
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = lib.bloom.BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"key {i}")
+    false_positives = sum(f"other key {i}" in bloom for i in range(10000))
+    # allow some slack over the configured 1%
+    assert false_positives < 200
+
+
+def test_bloom_filter_invalid_parameters():
+    with pytest.raises(ValueError):
+        lib.bloom.BloomFilter(0, 0.01)
+    with pytest.raises(ValueError):
+        lib.bloom.BloomFilter(100, 1.5)
+
+
+def test_scalable_bloom_filter_grows():
+    bloom = lib.bloom.ScalableBloomFilter(0.01, initial_capacity=100)
+    for i in range(1000):
+        bloom.add(i)
+    assert len(bloom.stages) > 1
+    assert len(bloom) == 1000
+    assert all(i in bloom for i in range(1000))
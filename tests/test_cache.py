@@ -1,5 +1,6 @@
 import datetime
 import logging
+import multiprocessing
 import os
 import time
 
@@ -101,6 +102,19 @@ def test_destructor(test_settings):
     assert time2 > time1
 
 
+def test_cache_file_respects_umask(tmp_path):
+    settings = lib.settings.TestSettings()
+    settings.local_cache = str(tmp_path / "cache.db")
+    umask = os.umask(0o022)
+    try:
+        cache = lib.cache.Cache(settings)
+        cache.add("Item")
+        cache.save()
+    finally:
+        os.umask(umask)
+    assert os.stat(settings.local_cache).st_mode & 0o777 == 0o644
+
+
 @pytest.fixture()
 def settings_data_cache(test_settings):
     test_cache_name = "test_data_cache.db"
@@ -153,3 +167,109 @@ def test_data_cache_freshness(data_cache):
     cache.cache["last_update"] = timestamp
     cache.save()
     assert cache.is_fresh()
+
+
+@pytest.fixture()
+def shared_settings(test_settings):
+    test_cache_name = "test_shared_cache.db"
+    if os.path.exists(test_cache_name):
+        os.unlink(test_cache_name)
+    test_settings.local_cache = test_cache_name
+    test_settings.shared_cache = True
+    return test_settings
+
+
+def test_shared_cache_merges_on_save(shared_settings):
+    """Two caches loaded at the same time must not lose each other's items."""
+    cache1 = lib.cache.Cache(shared_settings)
+    cache2 = lib.cache.Cache(shared_settings)
+    cache1.add("Item from worker 1")
+    cache2.add("Item from worker 2")
+    cache1.save()
+    cache2.save()
+    cache3 = lib.cache.Cache(shared_settings)
+    assert cache3.is_known("Item from worker 1")
+    assert cache3.is_known("Item from worker 2")
+    assert len(cache3.cache) == 2
+
+
+def _add_items_in_worker(settings, worker_id):
+    cache = lib.cache.Cache(settings)
+    for i in range(20):
+        cache.add(f"Worker {worker_id} item {i}")
+    cache.save()
+
+
+def test_shared_cache_with_several_processes(shared_settings):
+    workers = [
+        multiprocessing.Process(target=_add_items_in_worker, args=(shared_settings, i))
+        for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    cache = lib.cache.Cache(shared_settings)
+    assert len(cache.cache) == 80
+
+
+def test_shared_data_cache_merges_on_save(settings_data_cache):
+    if os.path.exists(settings_data_cache.data_cache):
+        os.unlink(settings_data_cache.data_cache)
+    settings_data_cache.shared_cache = True
+    cache1 = lib.cache.DataCache(settings_data_cache)
+    cache2 = lib.cache.DataCache(settings_data_cache)
+    cache1.add("url1", "data1")
+    cache2.add("url2", "data2")
+    cache1.save()
+    cache2.save()
+    cache3 = lib.cache.DataCache(settings_data_cache)
+    assert cache3.get("url1") == "data1"
+    assert cache3.get("url2") == "data2"
+    assert cache3.is_fresh("url1")
+    assert cache3.is_fresh("url3") is False
+
+
+@pytest.fixture()
+def retention_settings(test_settings):
+    test_cache_name = "test_retention_cache.db"
+    for file_name in (test_cache_name, f"{test_cache_name}.cold"):
+        if os.path.exists(file_name):
+            os.unlink(file_name)
+    test_settings.local_cache = test_cache_name
+    return test_settings
+
+
+def test_count_retention_moves_items_to_cold_tier(retention_settings):
+    retention_settings.cache_retention_count = 10
+    cache = lib.cache.Cache(retention_settings)
+    for i in range(25):
+        cache.add(f"Item {i}")
+    cache.save()
+    assert len(cache.cache) == 10
+    # the newest items stay in the hot list
+    assert "Item 24" in cache.cache
+    cache2 = lib.cache.Cache(retention_settings)
+    assert len(cache2.cache) == 10
+    assert all(cache2.is_known(f"Item {i}") for i in range(25))
+    assert cache2.is_known("Item 26") is False
+
+
+def test_age_retention_moves_items_to_cold_tier(retention_settings):
+    retention_settings.cache_retention_days = 30
+    cache = lib.cache.Cache(retention_settings)
+    cache.add("Old item")
+    cache.add("New item")
+    cache.cold["added_at"]["Old item"] = datetime.datetime.now() - datetime.timedelta(
+        days=31
+    )
+    assert cache.compact() == 1
+    assert cache.cache == ["New item"]
+    assert cache.is_known("Old item")
+
+
+def test_classifieds_are_known_by_hash(local_cache):
+    local_cache.add(lib.datastructures.Classified("Something", "Some street"))
+    assert local_cache.is_known(
+        lib.datastructures.Classified("Something", "Some street")
+    )
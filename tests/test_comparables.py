@@ -0,0 +1,115 @@
+import random
+
+import lib.comparables
+import lib.datastructures
+
+SEARCH = "https://www.ss.com/lv/real-estate/flats/riga/centre/sell/"
+
+
+def make_apartment(n, rooms, space, floor, price_per_m, series="602.", street="Stabu"):
+    apartment = lib.datastructures.Apartment(f"Flat {n}", f"{street} {n}")
+    apartment.rooms = str(rooms)
+    apartment.space = str(space)
+    apartment.floor = f"{floor}/9"
+    apartment.series = series
+    apartment.price_per_m = f"{price_per_m:,} €"
+    apartment.price = f"{price_per_m * space:,}  €"
+    return apartment
+
+
+def test_kd_tree_agrees_with_linear_search():
+    rng = random.Random(4)
+    points = [(rng.random(), rng.random(), rng.random()) for _ in range(500)]
+    tree = lib.comparables.KDTree([(p, n) for n, p in enumerate(points)])
+    for _ in range(20):
+        query = (rng.random(), rng.random(), rng.random())
+        expected = sorted(
+            range(len(points)),
+            key=lambda n: sum((a - b) ** 2 for a, b in zip(query, points[n])),
+        )[:5]
+        assert [n for _, n in tree.nearest(query, 5)] == expected
+
+
+def test_kd_tree_with_penalty():
+    tree = lib.comparables.KDTree([((0.0,), "near"), ((1.0,), "far")])
+    assert [i for _, i in tree.nearest((0.0,), 1)] == ["near"]
+    penalty = {"near": 5, "far": 0}
+    assert [i for _, i in tree.nearest((0.0,), 1, penalty.get)] == ["far"]
+
+
+def test_price_percentile():
+    index = lib.comparables.ComparablesIndex(k=10)
+    # two room flats in 602. series on the same street, and unlike ones
+    index.update(
+        (make_apartment(n, 2, 50, 3, 1000 + n * 10) for n in range(10)), SEARCH
+    )
+    index.update((make_apartment(100 + n, 5, 150, 8, 300) for n in range(200)), SEARCH)
+    cheap = make_apartment(1000, 2, 51, 4, 900)
+    assert index.score(cheap, SEARCH)
+    assert cheap.price_percentile == 0
+    assert cheap.comparable_count == 10
+    pricey = make_apartment(1001, 2, 49, 2, 1200)
+    index.score(pricey, SEARCH)
+    assert pricey.price_percentile == 100
+
+
+def test_trees_agree_with_linear_search():
+    rng = random.Random(5)
+    index = lib.comparables.ComparablesIndex(k=5)
+    flats = [
+        make_apartment(n, rng.randint(1, 5), rng.randint(20, 150), rng.randint(1, 9), n)
+        for n in range(1000)
+    ]
+    index.update(flats, SEARCH)
+    # trees of doubling sizes, and the points added since
+    sizes = [tree.size for tree in index.trees[(SEARCH, "apartment")]]
+    assert sizes == sorted(sizes, reverse=True) and len(sizes) <= 5
+    assert sum(sizes) + len(index.pending[(SEARCH, "apartment")]) == 1000
+    query = make_apartment(2000, 3, 60, 4, 0)
+    point = lib.comparables.features(query)[0]
+
+    def distance(flat):
+        other, categories = lib.comparables.features(flat)
+        d = sum((a - b) ** 2 for a, b in zip(point, other))
+        return d + (categories[1] != "stabu")
+
+    nearest = index.nearest(query, SEARCH)
+    expected = sorted(flats, key=distance)[:5]
+    assert len(nearest) == 5
+    assert sorted(distance(flats[int(p)]) for p in nearest) == [
+        distance(f) for f in expected
+    ]
+
+
+def test_searches_are_not_compared():
+    index = lib.comparables.ComparablesIndex(k=10)
+    index.add(make_apartment(1, 2, 50, 3, 1000), SEARCH)
+    assert not index.score(make_apartment(2, 2, 50, 3, 1000), "other search")
+    assert index.score(make_apartment(2, 2, 50, 3, 1000), SEARCH)
+
+
+def test_street_name():
+    assert lib.comparables.street_name("Tērbatas 14a") == "tērbatas"
+    assert lib.comparables.street_name("1. maija 5") == "1. maija"
+    assert lib.comparables.street_name("Dzirnavu 60 k-2") == "dzirnavu"
+
+
+def test_series_and_street_count():
+    index = lib.comparables.ComparablesIndex(k=1)
+    index.add(make_apartment(1, 2, 50, 3, 1000, series="Staļina"), SEARCH)
+    index.add(make_apartment(2, 2, 52, 3, 2000, series="602."), SEARCH)
+    index.add(make_apartment(3, 2, 50, 3, 3000, series="602.", street="Avotu"), SEARCH)
+    assert index.nearest(make_apartment(4, 2, 50, 3, 0), SEARCH) == [2000]
+
+
+def test_not_comparable():
+    index = lib.comparables.ComparablesIndex()
+    dog = lib.datastructures.Dog("Nice dog", "2 months")
+    assert not index.add(dog, SEARCH)
+    flat = make_apartment(1, 2, 50, 3, 1000)
+    assert not index.score(flat, SEARCH)
+    assert index.add(flat, SEARCH) and not index.add(flat, SEARCH)
+    house = lib.datastructures.House("House", "Avotu 1")
+    house.rooms, house.space, house.floors, house.price = "5", "200", "2", "100,000 €"
+    assert index.add(house, SEARCH)
+    assert lib.comparables.price_per_m(house) == 500
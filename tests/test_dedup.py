@@ -0,0 +1,71 @@
+import pytest
+
+import lib.datastructures
+import lib.dedup
+
+
+def make_apartment(title, street="Brīvības iela 100", rooms="2", space="54"):
+    apartment = lib.datastructures.Apartment(title, street)
+    apartment.rooms = rooms
+    apartment.space = space
+    return apartment
+
+
+TITLE = (
+    "Pārdod gaišu 2 istabu dzīvokli renovētā mājā, logi uz pagalmu, "
+    "blakus parks un sabiedriskais transports"
+)
+
+
+def test_lsh_bands_divide_signature():
+    for threshold in (0.5, 0.8, 0.9):
+        bands = lib.dedup.lsh_bands(128, threshold)
+        assert 128 % bands == 0
+        assert (1 / bands) ** (bands / 128) <= threshold
+
+
+def test_lsh_bands_low_and_invalid_thresholds():
+    assert lib.dedup.lsh_bands(128, 0.005) == 128
+    for threshold in (0, -0.5, 1.5):
+        with pytest.raises(ValueError):
+            lib.dedup.lsh_bands(128, threshold)
+
+
+def test_repost_is_found(tmp_path):
+    index = lib.dedup.RepostIndex(str(tmp_path / "cache.db.lsh"))
+    original = make_apartment(TITLE)
+    index.add(original)
+    index.add(make_apartment("Izīrē istabu", "Lāčplēša 1", "1", "20"))
+    repost = make_apartment(TITLE + " ļoti lēti")
+    match = index.find(repost)
+    assert match[0] == original.hash
+    assert match[1] >= 0.8
+
+
+def test_different_classified_is_not_a_repost(tmp_path):
+    index = lib.dedup.RepostIndex(str(tmp_path / "cache.db.lsh"))
+    index.add(make_apartment(TITLE))
+    assert index.find(make_apartment(TITLE, rooms="3", space="80")) is None
+    assert index.find(make_apartment("Izīrē istabu", "Lāčplēša 1", "1")) is None
+
+
+def test_index_is_saved_and_loaded(tmp_path):
+    file_name = str(tmp_path / "cache.db.lsh")
+    index = lib.dedup.RepostIndex(file_name)
+    original = make_apartment(TITLE)
+    index.add(original)
+    index.save()
+    index = lib.dedup.RepostIndex(file_name)
+    assert original in index
+    assert index.find(make_apartment(TITLE + " ļoti lēti"))[0] == original.hash
+
+
+def test_shared_index_merges_on_save(tmp_path):
+    file_name = str(tmp_path / "cache.db.lsh")
+    first = lib.dedup.RepostIndex(file_name, shared=True)
+    second = lib.dedup.RepostIndex(file_name, shared=True)
+    first.add(make_apartment("First flat"))
+    second.add(make_apartment("Second flat"))
+    first.save()
+    second.save()
+    assert len(lib.dedup.RepostIndex(file_name)) == 2
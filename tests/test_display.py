@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+import lib.datastructures
+import lib.display
+
+
+def make_apartment(title, rooms="3"):
+    apartment = lib.datastructures.Apartment(title, "Some street")
+    apartment.rooms = rooms
+    apartment.floor = "2/5"
+    return apartment
+
+
+def make_house(title):
+    return lib.datastructures.House(title, "House street")
+
+
+def test_ndjson_writer():
+    stream = io.StringIO()
+    writer = lib.display.NdjsonWriter(stream)
+    writer.write("apartment", "new", make_apartment("Flat 1"), "anna")
+    writer.write("apartment", "old", make_apartment("Flat 2"))
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record["profile"] == "anna"
+    assert record["status"] == "new"
+    assert record["type"] == "apartment"
+    assert record["title"] == "Flat 1"
+    assert record["rooms"] == "3"
+    assert json.loads(lines[1])["status"] == "old"
+
+
+def test_csv_writer():
+    stream = io.StringIO()
+    writer = lib.display.CsvWriter(stream)
+    writer.write("apartment", "new", make_apartment("Flat 1"))
+    writer.write("house", "old", make_house("House 1"))
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    assert len(rows) == 2
+    assert rows[0]["title"] == "Flat 1"
+    assert rows[0]["floor"] == "2/5"
+    assert rows[1]["category"] == "house"
+    assert rows[1]["rooms"] == ""
+
+
+def test_get_writer():
+    assert isinstance(lib.display.get_writer("csv"), lib.display.CsvWriter)
+    assert lib.display.get_writer("table") is None
+
+
+def test_old_houses_are_listed_under_houses(capsys):
+    results = {
+        "apartment": {"new": [], "old": [make_apartment("Old flat")]},
+        "house": {"new": [], "old": [make_house("Old house")]},
+    }
+    lib.display.print_results_to_console(results)
+    out, err = capsys.readouterr()
+    houses = out[out.index("Houses") :]
+    assert "Old house" in houses
+    assert "Old flat" not in houses
+
+
+def test_table_rows_are_capped(capsys):
+    results = {
+        "apartment": {
+            "new": [make_apartment("New flat")],
+            "old": [make_apartment(f"Old flat {i}") for i in range(10)],
+        }
+    }
+    lib.display.print_results_to_console(results, max_rows=3)
+    out, err = capsys.readouterr()
+    assert "New flat" in out
+    assert "Old flat 1" in out
+    assert "Old flat 2" not in out
+    assert "8 more" in out
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+import lib.cache
+import lib.fetch
+import lib.retriever
+import lib.settings
+
+URL = "https://www.ss.com/lv/real-estate/flats/riga/teika/sell/"
+
+
+class ScriptedTransport:
+    """Answers requests in order with the given status codes, exceptions or delays."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        step = self.script.pop(0) if self.script else 200
+        if isinstance(step, Exception):
+            raise step
+        delay = 0
+        if isinstance(step, tuple):
+            step, delay = step
+        time.sleep(delay)
+        return lib.fetch.Response(url, step, {}, f"{step} {delay}".encode(), delay)
+
+
+def make_transport(transport, **kwargs):
+    kwargs.setdefault("backoff", 0.001)
+    return lib.fetch.ResilientTransport(transport, **kwargs)
+
+
+def test_retries_until_success():
+    transport = ScriptedTransport(lib.fetch.FetchError("reset"), 503, 200)
+    response = make_transport(transport).get(URL)
+    assert response.status_code == 200
+    assert transport.requests == 3
+
+
+def test_gives_up_after_retries():
+    transport = ScriptedTransport(500, 500, 500, 200)
+    with pytest.raises(lib.fetch.FetchError):
+        make_transport(transport, retries=2).get(URL)
+    assert transport.requests == 3
+
+
+def test_client_errors_are_not_retried():
+    transport = ScriptedTransport(404)
+    with pytest.raises(lib.fetch.FetchError):
+        make_transport(transport).get(URL)
+    assert transport.requests == 1
+
+
+def test_circuit_opens_and_closes():
+    breaker = lib.fetch.CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    transport = ScriptedTransport(500, 500)
+    resilient = make_transport(transport, retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(lib.fetch.FetchError):
+            resilient.get(URL)
+    with pytest.raises(lib.fetch.CircuitOpenError):
+        resilient.get(URL)
+    assert transport.requests == 2
+    time.sleep(0.1)
+    assert resilient.get(URL).status_code == 200
+
+
+def test_hedged_request_wins_over_slow_one():
+    transport = ScriptedTransport((200, 1), (200, 0))
+    t_start = time.perf_counter()
+    response = make_transport(transport, hedge_after=0.05).get(URL)
+    assert time.perf_counter() - t_start < 0.5
+    assert response.content == b"200 0"
+    assert transport.requests == 2
+
+
+def test_failed_url_keeps_stale_data(tmp_path):
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    settings.cache_validity_time = 0
+    data_cache = lib.cache.DataCache(settings)
+    data_cache.add(URL, b"stale")
+    transport = make_transport(ScriptedTransport(500, 500, 500), retries=2)
+    r = lib.retriever.Retriever(settings, data_cache, transport)
+    assert r.update_data_cache([URL, "https://example.com/other/"]) == [
+        "https://example.com/other/"
+    ]
+    assert data_cache.get(URL) == b"stale"
+
+
+def test_blocked_url_keeps_stale_data(tmp_path):
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    settings.cache_validity_time = 0
+    data_cache = lib.cache.DataCache(settings)
+    data_cache.add(URL, b"stale")
+    transport = make_transport(ScriptedTransport(403, 403, 403), retries=2)
+    r = lib.retriever.Retriever(settings, data_cache, transport)
+    assert r.update_data_cache([URL]) == []
+    assert data_cache.get(URL) == b"stale"
+
+
+def test_page_without_listing_has_no_ads(tmp_path):
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    data_cache = lib.cache.DataCache(settings)
+    data_cache.add(URL, b"<html><body>Access denied</body></html>")
+    r = lib.retriever.Retriever(settings, data_cache, ScriptedTransport())
+    assert r.get_ads(URL, "apartment") == []
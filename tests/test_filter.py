@@ -0,0 +1,118 @@
+import lib.comparables
+import lib.datastructures
+import lib.dedup
+import lib.filter
+import lib.keywords
+import lib.settings
+
+
+class FakeRetriever:
+    def __init__(self, ads):
+        self.ads = ads
+
+    def get_ads(self, url, ad_type, is_known=None):
+        return self.ads[ad_type]
+
+
+class FakeCache(list):
+    def add(self, item):
+        self.append(item)
+
+    def is_known(self, item):
+        return item in self
+
+
+def make_apartment(title, rooms):
+    apartment = lib.datastructures.Apartment(title, "Some street")
+    apartment.rooms = rooms
+    apartment.floor = "1"
+    return apartment
+
+
+def make_filter(ads, cache):
+    settings = lib.settings.TestSettings()
+    settings.tracking_list = {
+        "apartment": {"url": "apartment_url", "filter_room_count": 3},
+        "dog": {"url": "dog_url"},
+    }
+    return lib.filter.Filter(FakeRetriever(ads), cache, settings)
+
+
+def test_filter_tracking_list():
+    known = make_apartment("Known flat", "4")
+    ads = {
+        "apartment": [
+            known,
+            make_apartment("Big flat", "3"),
+            make_apartment("Small flat", "1"),
+        ],
+        "dog": [lib.datastructures.Dog("Nice dog", "2 months")],
+    }
+    cache = FakeCache([known])
+    results = make_filter(ads, cache).filter_tracking_list()
+    assert [a.title for a in results["apartment"]["new"]] == ["Big flat"]
+    assert results["apartment"]["old"] == [known]
+    assert [d.title for d in results["dog"]["new"]] == ["Nice dog"]
+    # classifieds not matching the criteria are still remembered
+    assert len(cache) == 4
+
+
+def test_filter_tracking_list_reports_results_as_found():
+    ads = {
+        "apartment": [make_apartment("Big flat", "3")],
+        "dog": [lib.datastructures.Dog("Nice dog", "2 months")],
+    }
+    found = []
+    make_filter(ads, FakeCache()).filter_tracking_list(
+        lambda classified_type, status, classified: found.append(
+            (classified_type, status, classified.title)
+        )
+    )
+    assert found == [("apartment", "new", "Big flat"), ("dog", "new", "Nice dog")]
+
+
+def test_filter_flags_reposts(tmp_path):
+    title = "Pārdod gaišu 3 istabu dzīvokli renovētā mājā, blakus parks"
+    known = make_apartment(title, "3")
+    reposts = lib.dedup.RepostIndex(str(tmp_path / "cache.db.lsh"))
+    reposts.add(known)
+    ads = {"apartment": [make_apartment(title + " lēti", "3")], "dog": []}
+    classified_filter = make_filter(ads, FakeCache([known]))
+    classified_filter.reposts = reposts
+    results = classified_filter.filter_tracking_list()
+    assert results["apartment"]["new"][0].repost_of == known.hash
+
+
+def test_keyword_alerts_ignore_criteria():
+    ads = {
+        "apartment": [
+            make_apartment("Small flat on Tērbatas", "1"),
+            make_apartment("Small flat", "1"),
+        ],
+        "dog": [lib.datastructures.Dog("Franču buldogs", "2 months")],
+    }
+    f = make_filter(ads, FakeCache())
+    f.keywords = lib.keywords.KeywordMatcher(["terbatas", "buldogs"])
+    results = f.filter_tracking_list()
+    assert [(a.title, a.keywords) for a in results["apartment"]["new"]] == [
+        ("Small flat on Tērbatas", ["terbatas"])
+    ]
+    assert results["dog"]["new"][0].keywords == ["buldogs"]
+
+
+def test_new_apartments_are_priced_against_comparables():
+    comparables = lib.comparables.ComparablesIndex(k=2)
+    for n, price in enumerate(["1,000 €", "2,000 €"]):
+        known = make_apartment(f"Known flat {n}", "3")
+        known.space, known.price_per_m = "60", price
+        comparables.add(known, "url")
+    flat = make_apartment("Big flat", "3")
+    flat.space, flat.price_per_m = "60", "1,500 €"
+    settings = lib.settings.TestSettings()
+    settings.tracking_list = {"apartment": {"url": "url", "filter_room_count": 3}}
+    f = lib.filter.Filter(
+        FakeRetriever({"apartment": [flat]}), FakeCache(), settings, None, comparables
+    )
+    results = f.filter_tracking_list()
+    assert results["apartment"]["new"][0].price_percentile == 50
+    assert flat.comparable_count == 2
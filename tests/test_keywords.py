@@ -0,0 +1,43 @@
+import lib.datastructures
+import lib.keywords
+import lib.settings
+
+
+def test_find_keywords():
+    matcher = lib.keywords.KeywordMatcher(["Tērbatas", "Staļina", "ar", "he", "she"])
+    assert matcher.find("Tērbatas 14, staļina projekts") == {"Tērbatas", "Staļina"}
+    # diacritics and case are ignored
+    assert matcher.find("TERBATAS iela") == {"Tērbatas"}
+    # only whole words match
+    assert matcher.find("skats uz parku") == set()
+    assert matcher.find("ushers") == set()
+    assert matcher.find("she ar he") == {"she", "ar", "he"}
+
+
+def test_overlapping_keywords():
+    matcher = lib.keywords.KeywordMatcher(["Lāčplēša", "Lāčplēša iela", "iela"])
+    assert matcher.find("Lāčplēša iela 5") == {"Lāčplēša", "Lāčplēša iela", "iela"}
+
+
+def test_many_keywords():
+    keywords = [f"street{n}" for n in range(1000)] + ["Zemitāna"]
+    matcher = lib.keywords.KeywordMatcher(keywords)
+    assert matcher.find("Zemitāna 2b, street999 and street1000") == {
+        "Zemitāna",
+        "street999",
+    }
+
+
+def test_find_in_classified():
+    matcher = lib.keywords.KeywordMatcher(["Brīvības", "buldogs", "Renov."])
+    apartment = lib.datastructures.Apartment("Gaišs dzīvoklis", "Brīvības 100")
+    apartment.series = "Renov."
+    assert matcher.find_in_classified(apartment) == ["Brīvības", "Renov."]
+    dog = lib.datastructures.Dog("Franču buldogs", "2 months")
+    assert matcher.find_in_classified(dog) == ["buldogs"]
+
+
+def test_no_keywords():
+    settings = lib.settings.TestSettings()
+    assert lib.keywords.KeywordMatcher.from_settings(settings) is None
+    assert lib.keywords.KeywordMatcher([]).find("anything") == set()
@@ -2,7 +2,9 @@ from loguru import logger
 import pytest
 import lib.log
 import datetime
+import json
 import os
+import time
 
 now = datetime.datetime.now()
 
@@ -99,3 +101,84 @@ def test_log_rotation_works_as_expected(set_up_logging):
     # at this point rotation should have happened
     print(f"Log size now is: {get_log_size()}")
     assert get_log_size() < 1000
+
+
+def make_record(name, level="DEBUG", line=1, seconds=0):
+    return {
+        "name": name,
+        "level": logger.level(level),
+        "line": line,
+        "time": datetime.datetime(2021, 1, 1) + datetime.timedelta(seconds=seconds),
+        "message": "message",
+        "extra": {},
+    }
+
+
+def test_log_filter_levels_per_module():
+    log_filter = lib.log.LogFilter("DEBUG", {"lib": "INFO", "lib.filter": "WARNING"})
+    assert log_filter(make_record("tracker"))
+    assert not log_filter(make_record("lib.retriever"))
+    assert log_filter(make_record("lib.retriever", "INFO"))
+    assert not log_filter(make_record("lib.filter", "INFO"))
+    assert log_filter(make_record("lib.filter", "ERROR"))
+    # a module name is matched as a whole
+    assert log_filter(make_record("lib2"))
+
+
+def test_log_filter_rate_limit():
+    log_filter = lib.log.LogFilter(rate_limit=2)
+    passed = [log_filter(make_record("lib.filter", seconds=0.1 * n)) for n in range(5)]
+    assert passed == [True, True, False, False, False]
+    # other lines and warnings are not limited
+    assert log_filter(make_record("lib.filter", line=2, seconds=0.5))
+    assert log_filter(make_record("lib.filter", "WARNING", seconds=0.5))
+    record = make_record("lib.filter", seconds=1.2)
+    assert log_filter(record)
+    assert record["extra"]["suppressed"] == 3
+    assert record["message"] == "message"
+    assert "{extra[suppressed]} similar messages suppressed" in log_filter.format(
+        record
+    )
+
+
+def test_structured_log_in_background(tmp_path):
+    file_name = str(tmp_path / "structured.log")
+    lib.log.set_up_logging(
+        log_file_name=file_name, enqueue=True, serialize=True, rate_limit=5
+    )
+    for n in range(100):
+        logger.info(f"Parsed ad {n}")
+    logger.complete()
+    logger.remove()
+    with open(file_name) as log_file:
+        records = [json.loads(line)["record"] for line in log_file]
+    assert [r["message"] for r in records] == [f"Parsed ad {n}" for n in range(5)]
+
+
+def test_file_defaults_to_info(tmp_path):
+    file_name = str(tmp_path / "info.log")
+    lib.log.set_up_logging(log_file_name=file_name)
+    logger.debug("Parsed an ad")
+    logger.info("Run finished")
+    logger.remove()
+    with open(file_name) as log_file:
+        lines = log_file.readlines()
+    assert len(lines) == 1 and "Run finished" in lines[0]
+
+
+def test_suppressed_count_stays_in_its_sink(tmp_path):
+    file_name = str(tmp_path / "limited.log")
+    lib.log.set_up_logging(log_file_name=file_name, rate_limit=1)
+    messages = []
+    logger.add(messages.append, level="INFO", format="{message}")
+    for n in range(4):
+        if n == 3:
+            # the next second lets a record through again
+            time.sleep(1.05)
+        logger.info(f"Parsed ad {n}")
+    logger.remove()
+    assert messages == [f"Parsed ad {n}\n" for n in range(4)]
+    with open(file_name) as log_file:
+        lines = log_file.readlines()
+    assert len(lines) == 2
+    assert lines[1].rstrip().endswith("Parsed ad 3 [2 similar messages suppressed]")
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import lib.metrics
+
+
+@pytest.fixture
+def registry():
+    return lib.metrics.Registry()
+
+
+def test_counter(registry):
+    counter = registry.counter("test_total", "Test counter", ["status"])
+    counter.inc(status=200)
+    counter.inc(2, status=200)
+    counter.inc(status=404)
+    assert counter.get(status=200) == 3
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{status="200"} 3' in text
+    assert 'test_total{status="404"} 1' in text
+
+
+def test_labels_must_match(registry):
+    counter = registry.counter("test_total", "Test counter", ["status"])
+    with pytest.raises(ValueError):
+        counter.inc(url="something")
+
+
+def test_gauge(registry):
+    gauge = registry.gauge("test_items", "Test gauge")
+    gauge.set(5)
+    gauge.set(3)
+    assert "test_items 3" in registry.render()
+
+
+def test_histogram(registry):
+    histogram = registry.histogram("test_seconds", "Test histogram", buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        histogram.observe(value)
+    text = registry.render()
+    assert 'test_seconds_bucket{le="1"} 1' in text
+    assert 'test_seconds_bucket{le="5"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_sum 12.5" in text
+    assert "test_seconds_count 3" in text
+
+
+def test_label_values_are_escaped(registry):
+    gauge = registry.gauge("test_items", "Test gauge", ["url"])
+    gauge.set(1, url='say "hi"')
+    assert 'test_items{url="say \\"hi\\""} 1' in registry.render()
+
+
+def test_write_textfile(registry, tmp_path):
+    registry.counter("test_total", "Test counter").inc()
+    file_name = tmp_path / "tracker.prom"
+    registry.write_textfile(str(file_name))
+    assert file_name.read_text() == registry.render()
+    assert os.listdir(tmp_path) == ["tracker.prom"]
@@ -0,0 +1,217 @@
+import asyncio
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+import lib.datastructures
+import lib.notify
+import lib.settings
+
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/slow":
+            time.sleep(2)
+        if self.headers["Content-Type"] == "application/json":
+            body = json.loads(body)
+        else:
+            body = urllib.parse.parse_qs(body.decode())
+        self.server.received.append((self.path, body))
+        self.send_response(500 if self.path == "/broken" else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP to accept messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost")
+        while True:
+            command = self.rfile.readline().decode().strip()
+            verb = command[:4].upper()
+            if verb == "DATA":
+                self.reply("354 go ahead")
+                lines = []
+                while True:
+                    line = self.rfile.readline().decode()
+                    if line.rstrip("\r\n") == ".":
+                        break
+                    lines.append(line)
+                self.server.received.append("".join(lines))
+                self.reply("250 OK")
+            elif verb == "QUIT" or not command:
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+def serve(server):
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def webhook_server():
+    server = serve(http.server.ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def smtp_server():
+    server = serve(socketserver.ThreadingTCPServer(("127.0.0.1", 0), SmtpHandler))
+    yield server
+    server.shutdown()
+
+
+def make_results():
+    dog = lib.datastructures.Dog("Nice dog", "2 months")
+    dog.price = "500 €"
+    return {"dog": {"new": [dog], "old": []}}
+
+
+def make_settings(notify):
+    settings = lib.settings.TestSettings()
+    settings.tracking_list = {"dog": {"url": "dog_url", "notify": notify}}
+    return settings
+
+
+def test_webhook_and_smtp(webhook_server, smtp_server):
+    settings = make_settings(
+        [
+            {
+                "type": "webhook",
+                "url": f"http://127.0.0.1:{webhook_server.server_port}/hook",
+            },
+            {
+                "type": "smtp",
+                "host": "127.0.0.1",
+                "port": smtp_server.server_address[1],
+                "sender": "tracker@example.com",
+                "recipients": ["me@example.com"],
+            },
+        ]
+    )
+    assert lib.notify.send_notifications(settings, make_results()) == [True, True]
+    path, payload = webhook_server.received[0]
+    assert path == "/hook"
+    assert payload["title"] == "New dog found"
+    assert payload["classified"]["price"] == "500 €"
+    assert "Subject: New dog found" in smtp_server.received[0]
+
+
+def test_slow_channel_does_not_hold_up_others(webhook_server):
+    url = f"http://127.0.0.1:{webhook_server.server_port}"
+    settings = make_settings(
+        [
+            {"type": "webhook", "url": f"{url}/slow", "timeout": 0.3},
+            {"type": "webhook", "url": f"{url}/broken"},
+            {"type": "webhook", "url": f"{url}/fast"},
+        ]
+    )
+    t_start = time.perf_counter()
+    sent = lib.notify.send_notifications(settings, make_results())
+    assert time.perf_counter() - t_start < 1.5
+    assert sent == [False, False, True]
+    assert "/fast" in [path for path, _ in webhook_server.received]
+
+
+def test_reposts_are_not_sent(webhook_server):
+    settings = make_settings(
+        [{"type": "webhook", "url": f"http://127.0.0.1:{webhook_server.server_port}"}]
+    )
+    results = make_results()
+    results["dog"]["new"][0].repost_of = "abc"
+    assert lib.notify.send_notifications(settings, results) == []
+
+
+def test_keywords_are_sent(webhook_server):
+    settings = make_settings(
+        [{"type": "webhook", "url": f"http://127.0.0.1:{webhook_server.server_port}"}]
+    )
+    results = make_results()
+    results["dog"]["new"][0].keywords = ["buldogs", "kucēns"]
+    assert lib.notify.send_notifications(settings, results) == [True]
+    _, payload = webhook_server.received[0]
+    assert payload["message"].endswith("Keywords: buldogs, kucēns")
+
+
+def test_price_percentile_is_sent(webhook_server):
+    settings = make_settings(
+        [{"type": "webhook", "url": f"http://127.0.0.1:{webhook_server.server_port}"}]
+    )
+    results = make_results()
+    results["dog"]["new"][0].price_percentile = 20
+    results["dog"]["new"][0].comparable_count = 10
+    assert lib.notify.send_notifications(settings, results) == [True]
+    _, payload = webhook_server.received[0]
+    assert payload["message"].endswith("higher than 20% of 10 comparables")
+    assert payload["classified"]["price_percentile"] == 20
+
+
+class SleepingNotifier(lib.notify.Notifier):
+    channel = "test"
+
+    def __init__(self, seconds, timeout):
+        super().__init__(timeout)
+        self.seconds = seconds
+        self.sent = False
+
+    def send(self, title, message, classified=None):
+        time.sleep(self.seconds)
+        self.sent = True
+
+
+def test_hung_deliveries_do_not_block_queued_ones(monkeypatch):
+    monkeypatch.setattr(lib.notify, "MAX_CONCURRENT", 2)
+    hung = [SleepingNotifier(3, 0.5), SleepingNotifier(3, 0.5)]
+    fast = SleepingNotifier(0, 0.5)
+    deliveries = [(n, "title", "message", None) for n in hung + [fast]]
+    t_start = time.perf_counter()
+    assert asyncio.run(lib.notify.deliver(deliveries)) == [False, False, True]
+    assert time.perf_counter() - t_start < 2
+    assert fast.sent
+
+
+def test_pushover(webhook_server):
+    settings = lib.settings.TestSettings()
+    settings.pushover_enabled = True
+    settings.pushover_user_key = "user"
+    settings.pushover_api_token = "token"
+    notifier = lib.notify.PushoverNotifier(
+        settings, url=f"http://127.0.0.1:{webhook_server.server_port}/push"
+    )
+    notifier.send("New dog found", "Nice dog")
+    path, form = webhook_server.received[0]
+    assert path == "/push"
+    assert form == {
+        "token": ["token"],
+        "user": ["user"],
+        "title": ["New dog found"],
+        "message": ["Nice dog"],
+    }
+
+
+def test_notifiers_implement_send():
+    with pytest.raises(TypeError):
+        lib.notify.Notifier()
+
+
+def test_unknown_channel():
+    with pytest.raises(ValueError):
+        lib.notify.create_notifier({"type": "pigeon"}, None)
@@ -0,0 +1,53 @@
+import io
+import os
+
+from rich.console import Console
+
+import lib.profiling
+
+
+def busy_function():
+    return [str(i) for i in range(10000)]
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = lib.profiling.Profiler()
+    with profiler.phase("fetch"):
+        busy_function()
+    assert profiler.profiles == {}
+
+
+def test_phases_are_profiled(tmp_path):
+    profiler = lib.profiling.Profiler(str(tmp_path), top=5)
+    with profiler.phase("fetch"):
+        busy_function()
+    with profiler.phase("parse"):
+        data = busy_function()
+    with profiler.phase("fetch"):
+        busy_function()
+    assert list(profiler.profiles) == ["fetch", "parse"]
+    assert profiler.peak_memory["parse"] > 0
+    profiler.dump()
+    assert sorted(os.listdir(tmp_path)) == [
+        "00-fetch.memory.txt",
+        "00-fetch.prof",
+        "01-parse.memory.txt",
+        "01-parse.prof",
+    ]
+    output = io.StringIO()
+    profiler.print_summary(Console(file=output, width=200))
+    assert "busy_function" in output.getvalue()
+    assert "parse" in output.getvalue()
+
+
+def test_memory_statistics_do_not_grow_with_cycles(tmp_path):
+    profiler = lib.profiling.Profiler(str(tmp_path))
+    kept = []
+    for _ in range(5):
+        with profiler.phase("parse"):
+            kept.append(busy_function())
+    # one entry per line of code, summed up over the cycles
+    assert len(profiler.memory["parse"]) < 50
+    size, count = profiler.memory["parse"][f"{__file__}:10"]
+    assert count >= 5 * 10000
+    profiler.dump()
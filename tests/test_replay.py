@@ -0,0 +1,88 @@
+import os
+import time
+
+import pytest
+
+import lib.cache
+import lib.fetch
+import lib.replay
+import lib.retriever
+import lib.settings
+
+URL = "https://www.ss.com/lv/real-estate/flats/riga/teika/sell/"
+
+with open(os.path.join(os.path.dirname(__file__), "ss_listing.html"), "rb") as f:
+    LISTING = f.read()
+
+
+class FakeTransport:
+    """Stand-in for the network, answers every URL with the listing page."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(url)
+        return lib.fetch.Response(
+            url, 200, {"Content-Type": "text/html"}, LISTING, 0.05
+        )
+
+
+@pytest.fixture
+def archive(tmp_path):
+    recorder = lib.replay.RecordingTransport(str(tmp_path), FakeTransport())
+    recorder.get(URL)
+    return str(tmp_path)
+
+
+def test_replay_returns_recorded_response(archive):
+    response = lib.replay.ReplayTransport(archive).get(URL)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/html"
+    assert response.content == LISTING
+    assert response.elapsed == 0.05
+
+
+def test_replay_of_unknown_url_fails(archive, tmp_path):
+    transport = lib.replay.ReplayTransport(archive)
+    with pytest.raises(lib.fetch.FetchError):
+        transport.get("https://www.ss.com/unknown/")
+    # the retriever skips it like any URL that could not be retrieved
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    settings.cache_validity_time = 300
+    retriever = lib.retriever.Retriever(
+        settings, lib.cache.DataCache(settings), transport
+    )
+    assert retriever.update_data_cache(["https://www.ss.com/unknown/", URL]) == [URL]
+
+
+def test_replay_of_missing_archive_fails(tmp_path):
+    with pytest.raises(RuntimeError):
+        lib.replay.ReplayTransport(str(tmp_path / "missing"))
+
+
+def test_replay_with_latency(archive):
+    transport = lib.replay.ReplayTransport(archive, latency_factor=2)
+    t_start = time.perf_counter()
+    transport.get(URL)
+    assert time.perf_counter() - t_start >= 0.1
+
+
+def test_retriever_uses_transport(archive, tmp_path):
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    settings.cache_validity_time = 300
+    data_cache = lib.cache.DataCache(settings)
+    retriever = lib.retriever.Retriever(
+        settings, data_cache, lib.replay.ReplayTransport(archive)
+    )
+    retriever.update_data_cache([URL])
+    assert len(retriever.get_ads(URL, "apartment")) == 3
+    # fresh data is only retrieved again when forced
+    fake = FakeTransport()
+    retriever.transport = fake
+    retriever.update_data_cache([URL])
+    assert fake.requests == []
+    retriever.update_data_cache([URL], force=True)
+    assert fake.requests == [URL]
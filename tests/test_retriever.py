@@ -35,3 +35,54 @@ class TestRetriever:
         assert result.bozo is False
         assert result.status == 200
         assert isinstance(result.entries, list)
+
+
+@pytest.fixture
+def listing_data_cache():
+    settings = lib.settings.TestSettings()
+    settings.data_cache = "test_listing_data_cache.db"
+    settings.cache_validity_time = 300
+    if os.path.exists(settings.data_cache):
+        os.unlink(settings.data_cache)
+    cache = lib.cache.DataCache(settings)
+    with open(os.path.join(os.path.dirname(__file__), "ss_listing.html"), "rb") as f:
+        cache.add("listing_url", f.read())
+    return cache
+
+
+def test_get_ads(listing_data_cache):
+    r = lib.retriever.Retriever(listing_data_cache.settings, listing_data_cache)
+    ads = r.get_ads("listing_url", "apartment")
+    assert [a.rooms for a in ads] == ["3", "2", "4"]
+    # values enclosed in <b> tags are found too
+    assert ads[1].street == "Ropažu 10"
+    assert ads[1].price == "52,800  €"
+
+
+def test_get_ads_parses_every_url_once(listing_data_cache):
+    r = lib.retriever.Retriever(listing_data_cache.settings, listing_data_cache)
+    assert r.get_ads("listing_url", "apartment") is r.get_ads(
+        "listing_url", "apartment"
+    )
+
+
+def test_streaming_parse_matches_dom_parse(listing_data_cache):
+    r = lib.retriever.Retriever(listing_data_cache.settings, listing_data_cache)
+    expected = r.get_ads("listing_url", "apartment")
+    data = listing_data_cache.get("listing_url")
+    # small chunks make rows span several feeds
+    ads = [
+        lib.retriever.classified_from_row(row, "apartment")
+        for row in lib.retriever.iter_listing_rows(data, chunk_size=64)
+    ]
+    ads = [a for a in ads if a]
+    assert [vars(a) for a in ads] == [vars(a) for a in expected]
+
+
+def test_streaming_parse_stops_after_known(listing_data_cache):
+    settings = listing_data_cache.settings
+    settings.streaming_parse = True
+    settings.stop_after_known = 1
+    r = lib.retriever.Retriever(settings, listing_data_cache)
+    ads = r.get_ads("listing_url", "apartment", lambda ad: ad.rooms == "2")
+    assert [a.rooms for a in ads] == ["3", "2"]
@@ -0,0 +1,94 @@
+import pytest
+
+import lib.scheduler
+import lib.settings
+
+BUSY = "https://www.ss.com/lv/real-estate/flats/riga/all/sell/"
+QUIET = "https://www.ss.com/lv/animals/dogs/bouledogue-francais/sell/"
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return lib.scheduler.PollScheduler(
+        str(tmp_path / "scheduler.json"),
+        target_latency=1800,
+        min_interval=60,
+        max_interval=86400,
+    )
+
+
+def poll(scheduler, url, new_per_hour, hours, start=0):
+    """Simulate hourly polls that find new_per_hour classifieds each."""
+    for hour in range(hours + 1):
+        scheduler.observe(url, new_per_hour, now=start + hour * 3600)
+
+
+def test_unknown_urls_are_due(scheduler):
+    assert scheduler.due([BUSY, QUIET]) == [BUSY, QUIET]
+
+
+def test_rate_is_learned(scheduler):
+    poll(scheduler, BUSY, 12, 24)
+    assert scheduler.rate(BUSY) == pytest.approx(12 / 3600)
+
+
+def test_busy_urls_are_polled_more_often(scheduler):
+    poll(scheduler, BUSY, 12, 24)
+    poll(scheduler, QUIET, 0, 24)
+    intervals = scheduler.intervals([BUSY, QUIET])
+    assert intervals[BUSY] < intervals[QUIET]
+    assert intervals[QUIET] > 10 * intervals[BUSY]
+    # right after polling, only the busy URL becomes due soon
+    last_poll = 24 * 3600
+    assert scheduler.due([BUSY, QUIET], now=last_poll + intervals[BUSY] + 1) == [BUSY]
+
+
+def test_target_latency_is_kept(scheduler):
+    poll(scheduler, BUSY, 12, 24)
+    poll(scheduler, QUIET, 1, 24)
+    intervals = scheduler.intervals([BUSY, QUIET])
+    rates = {url: scheduler.rate(url) for url in intervals}
+    latency = sum(rates[u] * intervals[u] / 2 for u in intervals) / sum(rates.values())
+    assert latency == pytest.approx(1800)
+
+
+def test_request_budget(tmp_path):
+    scheduler = lib.scheduler.PollScheduler(
+        str(tmp_path / "scheduler.json"),
+        target_latency=60,
+        min_interval=60,
+        max_requests_per_hour=10,
+    )
+    urls = [f"{BUSY}page{i}.html" for i in range(10)]
+    intervals = scheduler.intervals(urls)
+    assert sum(3600 / i for i in intervals.values()) == pytest.approx(10)
+
+
+def test_state_persists(scheduler):
+    poll(scheduler, BUSY, 12, 24)
+    scheduler.save()
+    scheduler2 = lib.scheduler.PollScheduler(scheduler.state_file)
+    assert scheduler2.rate(BUSY) == pytest.approx(12 / 3600)
+
+
+def test_shared_state_merges_on_save(tmp_path):
+    """Two workers polling different URLs must not lose each other's statistics."""
+    state_file = str(tmp_path / "scheduler.json")
+    worker1 = lib.scheduler.PollScheduler(state_file, shared=True)
+    worker2 = lib.scheduler.PollScheduler(state_file, shared=True)
+    poll(worker1, BUSY, 12, 24)
+    poll(worker2, QUIET, 1, 24)
+    worker1.save()
+    worker2.save()
+    scheduler = lib.scheduler.PollScheduler(state_file)
+    assert scheduler.rate(BUSY) == pytest.approx(12 / 3600)
+    assert scheduler.rate(QUIET) == pytest.approx(1 / 3600)
+
+
+def test_from_settings():
+    settings = lib.settings.TestSettings()
+    assert lib.scheduler.PollScheduler.from_settings(settings) is None
+    settings.scheduler = {"state_file": "test_scheduler.json", "target_latency": 600}
+    scheduler = lib.scheduler.PollScheduler.from_settings(settings)
+    assert scheduler.target_latency == 600
+    assert scheduler.min_interval == 300
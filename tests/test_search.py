@@ -0,0 +1,56 @@
+import lib.datastructures
+import lib.search
+
+
+def make_apartment(title, street="Brīvības 1"):
+    return lib.datastructures.Apartment(title, street)
+
+
+def test_normalization():
+    assert lib.search.fold("Ķīpsala ŠĶŪNIS") == "kipsala skunis"
+    # inflections of a word are the same term
+    assert lib.search.terms("Kamīns") == lib.search.terms("kamīnu")
+    assert lib.search.terms("renovēts renovēta") == ["renovet", "renovet"]
+    # short words are kept as they are
+    assert lib.search.terms("ar uz") == ["ar", "uz"]
+
+
+def test_search_ranks_matches(tmp_path):
+    index = lib.search.SearchIndex(str(tmp_path / "search.db"))
+    both = make_apartment("Renovēts dzīvoklis ar kamīnu")
+    one = make_apartment("Dzīvoklis ar kamīnu un lielu balkonu pie parka")
+    none = make_apartment("Plašs dzīvoklis")
+    dog = lib.datastructures.Dog("Kucēns meklē mājas", "2 mēn.")
+    assert index.update([both, one, none, dog, "not a classified"]) == 4
+    results = index.search("kamīns renovēts")
+    assert [hash for _, hash, _, _ in results] == [both.hash, one.hash]
+    assert results[0][3] == "apartment"
+    assert index.search("KUCĒNI")[0][1] == dog.hash
+    assert index.search("kucēns", category="apartment") == []
+    assert index.search("nothing") == []
+
+
+def test_index_is_updated_incrementally(tmp_path):
+    file_name = str(tmp_path / "search.db")
+    index = lib.search.SearchIndex(file_name)
+    first = make_apartment("Dzīvoklis ar kamīnu")
+    index.update([first])
+    index.save()
+    index = lib.search.SearchIndex(file_name)
+    assert first in index
+    assert not index.add(first)
+    second = make_apartment("Māja ar kamīnu")
+    index.add(second)
+    index.save()
+    assert len(lib.search.SearchIndex(file_name).search("kamins")) == 2
+
+
+def test_shared_index_merges_on_save(tmp_path):
+    file_name = str(tmp_path / "search.db")
+    first = lib.search.SearchIndex(file_name, shared=True)
+    second = lib.search.SearchIndex(file_name, shared=True)
+    first.add(make_apartment("Dzīvoklis ar kamīnu"))
+    second.add(make_apartment("Māja ar kamīnu"))
+    first.save()
+    second.save()
+    assert len(lib.search.SearchIndex(file_name).search("kamins")) == 2
@@ -39,3 +39,29 @@ class TestSettings:
             s = lib.settings.Settings(
                 settings_file_name=self.settings_invalid_file_name
             )
+
+    def test_shard_tracking_list(self, chdir):
+        names = set()
+        for worker_id in range(3):
+            s = lib.settings.Settings(settings_file_name=self.settings_file_name)
+            s.shard_tracking_list(worker_id, 3)
+            assert s.shared_cache
+            assert not names & s.tracking_list.keys()
+            names |= s.tracking_list.keys()
+        assert names == {"apartment", "house", "dog"}
+
+    def test_without_profiles_settings_are_the_only_profile(self, chdir, load_settings):
+        assert load_settings.get_profiles() == [load_settings]
+
+    def test_profiles(self, chdir):
+        s = lib.settings.Settings(settings_file_name="settings.test.profiles.json")
+        anna, janis = s.get_profiles()
+        assert anna.name == "anna"
+        assert anna.pushover_user_key == "anna_key"
+        assert anna.local_cache == "cache.anna.db"
+        assert anna.cache_validity_time == 600
+        assert anna.tracking_list["apartment"]["filter_room_count"] == 3
+        assert janis.pushover_user_key == "testtest"
+        assert janis.local_cache == "janis.db"
+        assert janis.data_cache == "data_cache.db"
+        assert set(janis.tracking_list) == {"apartment", "dog"}
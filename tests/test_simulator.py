@@ -0,0 +1,69 @@
+import html
+import urllib.error
+import urllib.request
+
+import pytest
+
+import lib.cache
+import lib.retriever
+import lib.settings
+import lib.simulator
+
+
+@pytest.fixture
+def site():
+    return lib.simulator.SimulatedSite(ads_per_page=20, pages=3, churn=0.1, seed=1)
+
+
+def parse(site, category, page, tmp_path, streaming=False):
+    settings = lib.settings.TestSettings()
+    settings.data_cache = str(tmp_path / "data_cache.db")
+    settings.cache_validity_time = 300
+    settings.streaming_parse = streaming
+    data_cache = lib.cache.DataCache(settings)
+    data_cache.add("url", site.render_page(category, page))
+    return lib.retriever.Retriever(settings, data_cache).get_ads("url", category)
+
+
+@pytest.mark.parametrize("category", ["apartment", "house", "dog"])
+def test_pages_are_parsed(site, category, tmp_path):
+    highlighted = site.ads[category][25]
+    highlighted["highlighted"] = True
+    # highlighted classifieds are wrapped in <b> tags
+    title = html.escape(highlighted["title"])
+    assert f"<b>{title}</b>".encode() in site.render_page(category, 2)
+    ads = parse(site, category, 2, tmp_path)
+    assert len(ads) == 20
+    expected = site.ads[category][20:40]
+    assert [a.title for a in ads] == [ad["title"] for ad in expected]
+    # and their cells are parsed like those of any other classified
+    assert ads[5].price == highlighted["cells"][-1]
+
+
+def test_streaming_parser_agrees(site, tmp_path):
+    ads = parse(site, "apartment", 1, tmp_path)
+    streamed = parse(site, "apartment", 1, tmp_path, streaming=True)
+    assert [vars(a) for a in streamed] == [vars(a) for a in ads]
+
+
+def test_tick_replaces_oldest_classifieds(site):
+    first = site.ads["dog"][0]
+    last = site.ads["dog"][-1]
+    assert site.tick() == 3 * 6
+    assert site.ads["dog"][6] is first
+    assert last not in site.ads["dog"]
+    assert len(site.ads["dog"]) == 60
+
+
+def test_server(site):
+    server = lib.simulator.SimulatorServer(site)
+    server.start()
+    try:
+        with urllib.request.urlopen(server.url("house", 3)) as response:
+            page = response.read().decode("utf-8")
+        assert 'id="filter_frm"' in page
+        assert 'href="/lv/house/page2.html"' in page
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(server.url("house", 4))
+    finally:
+        server.stop()
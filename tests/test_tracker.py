@@ -0,0 +1,181 @@
+import json
+from click.testing import CliRunner
+
+import lib.api
+import lib.archive
+import lib.cache
+import lib.datastructures
+import lib.search
+import lib.settings
+import lib.simulator
+import tracker
+
+
+def test_prices_command(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = lib.archive.PriceArchive(str(tmp_path / "archive"))
+    flat = lib.datastructures.Apartment("Flat", "Tērbatas 1")
+    flat.price = "90,000  €"
+    flat.price_per_m = "1,000 €"
+    archive.append([flat], timestamp=100)
+    with open("settings.json", "w") as f:
+        json.dump(
+            {
+                "pushover_enabled": False,
+                "pushover_user_key": "",
+                "pushover_api_token": "",
+                "local_cache": "cache.db",
+                "data_cache": "data_cache.db",
+                "cache_validity_time": 600,
+                "price_archive": "archive",
+                "tracking_list": {},
+            },
+            f,
+        )
+    runner = CliRunner()
+    result = runner.invoke(tracker.main, ["prices"])
+    assert result.exit_code == 0
+    assert result.output == "Tērbatas 1\t1000\n"
+    result = runner.invoke(tracker.main, ["prices", "--ad", flat.hash])
+    assert result.output.endswith("\t90000\n")
+
+
+def test_search_command(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = lib.search.SearchIndex("search.db")
+    flat = lib.datastructures.Apartment("Dzīvoklis ar kamīnu", "Tērbatas 1")
+    index.add(flat)
+    index.save()
+    with open("settings.json", "w") as f:
+        json.dump(
+            {
+                "pushover_enabled": False,
+                "pushover_user_key": "",
+                "pushover_api_token": "",
+                "local_cache": "cache.db",
+                "data_cache": "data_cache.db",
+                "cache_validity_time": 600,
+                "search_index": "search.db",
+                "tracking_list": {},
+            },
+            f,
+        )
+    result = CliRunner().invoke(tracker.main, ["search", "kamīns"])
+    assert result.exit_code == 0
+    assert result.output.endswith(f"\tapartment\tDzīvoklis ar kamīnu\t{flat.hash}\n")
+    # the run is timed in the debug log
+    result = CliRunner().invoke(tracker.main, ["--debug", "search", "kamīns"])
+    assert "Function call: main executed in:" in result.output
+
+
+def test_backfill_command(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = lib.simulator.SimulatedSite(ads_per_page=10, pages=4, seed=3)
+    server = lib.simulator.SimulatorServer(site)
+    server.start()
+    with open("settings.json", "w") as f:
+        json.dump(
+            {
+                "pushover_enabled": False,
+                "pushover_user_key": "",
+                "pushover_api_token": "",
+                "local_cache": "cache.db",
+                "data_cache": "data_cache.db",
+                "cache_validity_time": 600,
+                "tracking_list": {
+                    "apartment": {"url": server.url("apartment")},
+                    "dog": {"url": server.url("dog")},
+                },
+            },
+            f,
+        )
+    try:
+        result = CliRunner().invoke(
+            tracker.main, ["backfill", "--category", "apartment"]
+        )
+    finally:
+        server.stop()
+    assert result.exit_code == 0
+    assert result.output == f"apartment\t{server.url('apartment')}\t40 added\n"
+    settings = lib.settings.TestSettings("cache.db")
+    assert len(lib.cache.Cache(settings).cache) == 40
+    with open("cache.db.backfill") as f:
+        assert len(f.readlines()) == 4
+
+
+def test_open_circuit_lasts_across_cycles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = lib.simulator.SimulatedSite(ads_per_page=10, pages=1, churn=0.5, seed=4)
+    server = lib.simulator.SimulatorServer(site)
+    server.start()
+    with open("settings.json", "w") as f:
+        json.dump(
+            {
+                "pushover_enabled": False,
+                "pushover_user_key": "",
+                "pushover_api_token": "",
+                "local_cache": "cache.db",
+                "data_cache": "data_cache.db",
+                "cache_validity_time": 0,
+                "fetch": {"retries": 0},
+                "tracking_list": {"dog": {"url": server.url("dog")}},
+            },
+            f,
+        )
+    settings = lib.settings.Settings("settings.json")
+    t = tracker.Tracker(settings, settings.get_profiles(), print=False)
+    try:
+        assert len(t.run_cycle()["default"]["dog"]["new"]) == 10
+        for _ in range(3):
+            t.transport.breaker.record_failure(f"127.0.0.1:{server.port}")
+        site.tick()
+        # the page is not retrieved again, the cached one has nothing new
+        assert t.run_cycle()["default"]["dog"]["new"] == []
+    finally:
+        server.stop()
+        del t
+
+
+class FailingTracker:
+    settings = lib.settings.TestSettings()
+
+    def run_cycle(self):
+        raise RuntimeError("unexpected")
+
+
+def test_serve_cycle_survives_errors():
+    assert not tracker.serve_cycle(FailingTracker(), lib.api.ClassifiedIndex())
+
+
+def test_cycle_appends_to_price_archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = lib.simulator.SimulatedSite(ads_per_page=10, pages=1, seed=5)
+    server = lib.simulator.SimulatorServer(site)
+    server.start()
+    with open("settings.json", "w") as f:
+        json.dump(
+            {
+                "pushover_enabled": False,
+                "pushover_user_key": "",
+                "pushover_api_token": "",
+                "local_cache": "cache.db",
+                "data_cache": "data_cache.db",
+                "cache_validity_time": 0,
+                "price_archive": "archive",
+                "tracking_list": {
+                    "apartment": {
+                        "url": server.url("apartment"),
+                        "filter_room_count": 1,
+                    }
+                },
+            },
+            f,
+        )
+    settings = lib.settings.Settings("settings.json")
+    t = tracker.Tracker(settings, settings.get_profiles(), print=False)
+    try:
+        t.run_cycle()
+    finally:
+        server.stop()
+        del t
+    assert len(lib.archive.PriceArchive("archive")) == 10
@@ -6,43 +6,477 @@
 #
 # kaspars@fx.lv
 #
+import datetime
+import functools
 import json
+import time
 import click
+from loguru import logger
+import lib.api
+import lib.archive
+import lib.backfill
 import lib.cache
+import lib.comparables
 import lib.datastructures
-import lib.push
+import lib.dedup
+import lib.fetch
+import lib.metrics
+import lib.notify
+import lib.profiling
+import lib.replay
 import lib.retriever
-from lib.display import print_results_to_console
+import lib.scheduler
+import lib.search
+from lib.display import get_writer, print_results_to_console
 from lib.filter import Filter
 import lib.settings
-from lib.log import func_log, set_up_logging
-from lib.push import send_push
+from lib.log import set_up_logging
 
 
-@func_log
-@click.command()
+class Tracker:
+    """Retrieve, filter and report classifieds of all profiles."""
+
+    def __init__(
+        self,
+        settings,
+        profiles,
+        print=True,
+        push=False,
+        writer=None,
+        max_rows=None,
+        transport=None,
+        force_update=False,
+        profiler=None,
+    ):
+        self.settings = settings
+        self.profiles = profiles
+        self.print = print
+        self.push = push
+        self.writer = writer
+        self.max_rows = max_rows
+        # built once, so that circuit breakers and identity cooldowns last across cycles
+        self.transport = transport or lib.fetch.ResilientTransport.from_settings(
+            settings
+        )
+        # retrieve every URL, even if the data cache is still fresh
+        self.force_update = force_update
+        self.profiler = profiler or lib.profiling.Profiler()
+        self.scheduler = lib.scheduler.PollScheduler.from_settings(settings)
+        self.archive = lib.archive.PriceArchive.from_settings(settings)
+        with self.profiler.phase("cache load"):
+            self.data_cache = lib.cache.DataCache(settings)
+            self.caches = {
+                profile.name: lib.cache.Cache(profile) for profile in profiles
+            }
+            self.reposts = {}
+            for profile in profiles:
+                reposts = lib.dedup.RepostIndex.from_settings(profile)
+                if reposts is not None:
+                    # classifieds seen before repost detection was enabled are indexed once
+                    reposts.update(self.caches[profile.name].cache)
+                    self.reposts[profile.name] = reposts
+            # rebuilt from the caches, a profile tracks one search per category,
+            # so that is the search its cached classifieds were found by
+            self.comparables = lib.comparables.ComparablesIndex.from_settings(settings)
+            if self.comparables is not None:
+                for profile in profiles:
+                    for classified in self.caches[profile.name].cache:
+                        entry = profile.tracking_list.get(
+                            type(classified).__name__.lower()
+                        )
+                        if entry:
+                            self.comparables.add(classified, entry["url"])
+            self.search_index = lib.search.SearchIndex.from_settings(settings)
+            if self.search_index is not None:
+                # classifieds seen before the index was enabled are indexed once
+                for cache in self.caches.values():
+                    self.search_index.update(cache.cache)
+
+    def tracked(self) -> list:
+        """Return unique (URL, classified type) pairs tracked by any profile."""
+        tracked = []
+        for profile in self.profiles:
+            for classified_type, entry in profile.tracking_list.items():
+                if (entry["url"], classified_type) not in tracked:
+                    tracked.append((entry["url"], classified_type))
+        return tracked
+
+    def run_cycle(self) -> dict:
+        """Retrieve, filter and report classifieds of all profiles once.
+
+        Returns the results of every profile, keyed by profile name.
+        """
+        retriever = lib.retriever.Retriever(
+            self.settings, self.data_cache, self.transport
+        )
+
+        # every unique URL is retrieved once, no matter how many profiles track it
+        tracked = self.tracked()
+        urls = list(dict.fromkeys(url for url, _ in tracked))
+        with self.profiler.phase("fetch"):
+            if self.scheduler and not self.force_update:
+                # the scheduler decides when to poll instead of the data cache age
+                retrieved = retriever.update_data_cache(
+                    self.scheduler.due(urls), force=True
+                )
+            else:
+                retrieved = retriever.update_data_cache(urls, self.force_update)
+        with self.profiler.phase("parse"):
+            for url, classified_type in tracked:
+                # parsing may stop early only at ads known to every profile tracking the URL
+                caches = [
+                    self.caches[profile.name]
+                    for profile in self.profiles
+                    if (profile.tracking_list.get(classified_type) or {}).get("url")
+                    == url
+                ]
+                retriever.get_ads(
+                    url,
+                    classified_type,
+                    lambda ad, caches=caches: all(c.is_known(ad) for c in caches),
+                )
+        if self.archive is not None:
+            with self.profiler.phase("archive"):
+                # cached pages would only repeat the previous observations
+                for url, classified_type in tracked:
+                    if url in retrieved:
+                        self.archive.append(retriever.get_ads(url, classified_type))
+
+        all_results = {}
+        new_counts = {}
+        for profile in self.profiles:
+            classified_filter = Filter(
+                retriever,
+                self.caches[profile.name],
+                profile,
+                self.reposts.get(profile.name),
+                self.comparables,
+            )
+            on_result = None
+            if self.writer:
+                on_result = functools.partial(self.writer.write, profile=profile.name)
+            with self.profiler.phase("filter"):
+                results = classified_filter.filter_tracking_list(on_result)
+            all_results[profile.name] = results
+            for url, count in classified_filter.new_counts.items():
+                new_counts[url] = max(new_counts.get(url, 0), count)
+
+            if self.print and not self.writer:
+                title = profile.name if len(self.profiles) > 1 else None
+                with self.profiler.phase("display"):
+                    print_results_to_console(results, title, self.max_rows)
+
+            if self.push:
+                with self.profiler.phase("push"):
+                    lib.notify.send_notifications(profile, results)
+
+        if self.comparables is not None:
+            # added after all profiles are filtered, so none is compared with itself
+            for url, classified_type in tracked:
+                self.comparables.update(retriever.get_ads(url, classified_type), url)
+
+        if self.search_index is not None:
+            for results in all_results.values():
+                for result in results.values():
+                    self.search_index.update(result["new"] + result["old"])
+
+        if self.scheduler:
+            # only freshly retrieved data says something about the posting rate
+            for url in retrieved:
+                self.scheduler.observe(url, new_counts.get(url, 0))
+            self.scheduler.save()
+        return all_results
+
+    def save(self) -> None:
+        with self.profiler.phase("cache save"):
+            self.data_cache.save()
+            for cache in self.caches.values():
+                cache.save()
+            self.save_indexes()
+
+    def save_indexes(self) -> None:
+        """Save the indexes, unlike the caches they are not saved on destruction."""
+        for reposts in self.reposts.values():
+            reposts.save()
+        if self.search_index is not None:
+            self.search_index.save()
+
+
+def serve_cycle(tracker: Tracker, index) -> bool:
+    """Run a tracker cycle and update the API index with its results.
+
+    Errors are logged and the cycle skipped, so that the server keeps running.
+    """
+    try:
+        all_results = tracker.run_cycle()
+        for profile_name, results in all_results.items():
+            index.update(results, profile_name)
+        tracker.save()
+        if tracker.settings.metrics_file:
+            lib.metrics.REGISTRY.write_textfile(tracker.settings.metrics_file)
+    except Exception:
+        logger.exception("Tracker cycle failed, trying again in the next one")
+        return False
+    return True
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
 @click.option("--debug", is_flag=True, default=False, help="Print DEBUG log to screen")
 @click.option("--print/--no-print", default=True, help="Print results to console")
 @click.option("--push/--no-push", default=False, help="Send push notifications")
-def main(debug, print, push):
-
+@click.option(
+    "--settings",
+    "settings_file",
+    default="settings.json",
+    help="Settings file to use",
+)
+@click.option(
+    "--worker-id", default=0, help="Index of this worker when running several workers"
+)
+@click.option(
+    "--workers",
+    default=1,
+    help="Number of workers splitting the tracking list, they share the caches",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "ndjson", "csv"]),
+    default="table",
+    help="Output format, ndjson and csv are written as soon as a classified is found",
+)
+@click.option("--max-rows", type=int, default=None, help="Maximum rows per table")
+@click.option(
+    "--serve",
+    type=int,
+    default=None,
+    help="Keep running and serve the classifieds as JSON over HTTP on this port",
+)
+@click.option(
+    "--interval",
+    type=int,
+    default=None,
+    help="Seconds between tracker cycles when serving, defaults to cache_validity_time",
+)
+@click.option(
+    "--profile",
+    "profile_dir",
+    default=None,
+    help="Write CPU and memory profiles of every phase to this directory",
+)
+@click.option(
+    "--record",
+    "record_dir",
+    default=None,
+    help="Record all responses to this directory",
+)
+@click.option(
+    "--replay",
+    "replay_dir",
+    default=None,
+    help="Replay responses recorded to this directory instead of using the network",
+)
+@click.option(
+    "--replay-latency",
+    default=0.0,
+    help="Delay replayed responses by their recorded time multiplied by this factor",
+)
+def main(
+    ctx,
+    debug,
+    print,
+    push,
+    settings_file,
+    worker_id,
+    workers,
+    output_format,
+    max_rows,
+    serve,
+    interval,
+    profile_dir,
+    record_dir,
+    replay_dir,
+    replay_latency,
+):
+    """Track classifieds, or run one of the commands on the collected data."""
     set_up_logging(debug)
-    settings = lib.settings.Settings()
-    cache = lib.cache.Cache(settings)
-    data_cache = lib.cache.DataCache(settings)
+    # timed like the functions decorated with func_log, including any subcommand
+    t_start = time.time()
+    ctx.call_on_close(
+        lambda: logger.debug(
+            f"Function call: main executed in: {time.time() - t_start:5.5f} sec"
+        )
+    )
+    if ctx.invoked_subcommand is not None:
+        ctx.obj = {"settings_file": settings_file}
+        return
+    profiler = lib.profiling.Profiler(profile_dir)
+    with profiler.phase("settings load"):
+        settings = lib.settings.Settings(settings_file)
+        if settings.logging:
+            set_up_logging(debug, **settings.logging)
+        settings.shard_tracking_list(worker_id, workers)
+        profiles = settings.get_profiles()
+        for profile in profiles:
+            profile.shard_tracking_list(worker_id, workers)
+
+    transport = None
+    if replay_dir:
+        transport = lib.replay.ReplayTransport(replay_dir, replay_latency)
+    elif record_dir:
+        transport = lib.replay.RecordingTransport(
+            record_dir, lib.fetch.ResilientTransport.from_settings(settings)
+        )
+    tracker = Tracker(
+        settings,
+        profiles,
+        print=print,
+        push=push,
+        writer=get_writer(output_format) if print else None,
+        max_rows=max_rows,
+        transport=transport,
+        # replayed and recorded runs retrieve everything, not just stale URLs
+        force_update=transport is not None,
+        profiler=profiler,
+    )
+
+    if serve is None:
+        tracker.run_cycle()
+        # saved here rather than by the destructors, which may run
+        # when the interpreter is already shutting down
+        tracker.save()
+        if profiler.enabled:
+            profiler.dump()
+            profiler.print_summary()
+        if settings.metrics_file:
+            lib.metrics.REGISTRY.write_textfile(settings.metrics_file)
+        return
+
+    # long running mode, the index is built from the caches once
+    # and then updated with the results of every cycle
+    index = lib.api.ClassifiedIndex()
+    for profile in profiles:
+        index.add_history(tracker.caches[profile.name].cache, profile.name)
+    server = lib.api.ApiServer(index, port=serve)
+    server.start()
+    try:
+        while True:
+            serve_cycle(tracker, index)
+            time.sleep(interval or settings.cache_validity_time)
+    finally:
+        server.stop()
+        profiler.dump()
+        profiler.print_summary()
+
+
+@main.command()
+@click.pass_obj
+@click.option("--ad", "ad_hash", default=None, help="Print the price history of an ad")
+@click.option(
+    "--column",
+    type=click.Choice(lib.archive.ATTRIBUTES),
+    default=None,
+    help="Value to report, price for --ad and price_per_m for medians by default",
+)
+@click.option(
+    "--days", type=int, default=None, help="Only use observations from the last days"
+)
+def prices(obj, ad_hash, column, days):
+    """Print the price history of an ad or median prices per street."""
+    settings = lib.settings.Settings(obj["settings_file"])
+    archive = lib.archive.PriceArchive.from_settings(settings)
+    if archive is None:
+        raise click.ClickException("price_archive is not set in settings")
+    if ad_hash:
+        for timestamp, value in archive.price_series(ad_hash, column or "price"):
+            observed = datetime.datetime.fromtimestamp(timestamp)
+            click.echo(f"{observed:%Y-%m-%d %H:%M}\t{value:g}")
+        return
+    since = time.time() - days * 86400 if days else None
+    medians = archive.street_medians(column or "price_per_m", since)
+    for street, median in sorted(medians.items()):
+        click.echo(f"{street}\t{median:g}")
+
 
-    retriever = lib.retriever.Retriever(settings, data_cache)
-    classified_filter = Filter(retriever, cache, settings)
+@main.command()
+@click.pass_obj
+@click.argument("query", nargs=-1, required=True)
+@click.option("--limit", default=20, help="Maximum number of results")
+@click.option(
+    "--category",
+    type=click.Choice(["apartment", "house", "dog"]),
+    default=None,
+    help="Only search classifieds of this category",
+)
+def search(obj, query, limit, category):
+    """Search the titles of all classifieds seen so far, best matches first."""
+    settings = lib.settings.Settings(obj["settings_file"])
+    index = lib.search.SearchIndex.from_settings(settings)
+    if index is None:
+        raise click.ClickException("search_index is not set in settings")
+    for score, ad_hash, title, found_category in index.search(
+        " ".join(query), limit, category
+    ):
+        click.echo(f"{score:6.2f}\t{found_category}\t{title}\t{ad_hash}")
 
-    if not data_cache.is_fresh():
-        retriever.update_data_cache()
-    results = classified_filter.filter_tracking_list()
 
-    if print:
-        print_results_to_console(results)
+@main.command()
+@click.pass_obj
+@click.option(
+    "--category",
+    "categories",
+    multiple=True,
+    type=click.Choice(["apartment", "house", "dog"]),
+    help="Only backfill these categories, can be given several times",
+)
+@click.option("--concurrency", default=4, help="Pages retrieved at the same time")
+@click.option("--max-pages", type=int, default=None, help="Pages to crawl per search")
+@click.option(
+    "--journal",
+    default=None,
+    help="Checkpoint journal, defaults to the local cache file name with .backfill",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    default=False,
+    help="Crawl every page again, even those already in the journal",
+)
+def backfill(obj, categories, concurrency, max_pages, journal, restart):
+    """Mark all classifieds of the tracked searches as seen, without notifications.
 
-    if push:
-        send_push(settings, results)
+    Every page of every search is crawled. An interrupted backfill
+    continues where it stopped when run again. Searches are backfilled
+    again for caches that did not have them yet, or lost them.
+    """
+    settings = lib.settings.Settings(obj["settings_file"])
+    profiles = settings.get_profiles()
+    tracker = Tracker(settings, profiles, print=False)
+    journal = lib.backfill.BackfillJournal(
+        journal or f"{settings.local_cache}.backfill"
+    )
+    crawler = lib.backfill.Backfill(
+        tracker.transport,
+        journal,
+        concurrency,
+        max_pages=max_pages,
+    )
+    for url, classified_type in tracker.tracked():
+        if categories and classified_type not in categories:
+            continue
+        caches = [
+            tracker.caches[profile.name]
+            for profile in profiles
+            if (profile.tracking_list.get(classified_type) or {}).get("url") == url
+        ]
+        added = crawler.run(url, classified_type, caches, restart)
+        click.echo(f"{classified_type}\t{url}\t{added} added")
+    tracker.save()
+    if crawler.failed:
+        raise click.ClickException(
+            f"{len(crawler.failed)} pages failed, run backfill again to retry them"
+        )
 
 
 if __name__ == "__main__":